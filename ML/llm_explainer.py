@@ -5,16 +5,23 @@ Falls back to template-based generation if API key is not set.
 """
 
 import os
+import asyncio
 import logging
+import threading
+import functools
+import importlib.util
+from collections import OrderedDict
+
+import orjson
 
 logger = logging.getLogger(__name__)
 
-try:
-    import anthropic
-    ANTHROPIC_AVAILABLE = True
-except ImportError:
-    ANTHROPIC_AVAILABLE = False
+# anthropic (and httpx/pydantic under it) is only imported on the first
+# Claude call, so template-only deployments never pay for it.
+ANTHROPIC_AVAILABLE = importlib.util.find_spec("anthropic") is not None
+if not ANTHROPIC_AVAILABLE:
     logger.warning("anthropic package not installed. Using template fallback.")
+_anthropic = None
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -91,35 +98,59 @@ DRUG_DOSING = {
     },
 }
 
+# Lower-cased (key, text) pairs, built once so the template path does not
+# re-lowercase every key on each call. Order matches the source dicts.
+GENE_MECHANISMS_LC = {
+    gene: [(k.lower(), v) for k, v in mechs.items()]
+    for gene, mechs in GENE_MECHANISMS.items()
+}
+DRUG_DOSING_LC = {
+    drug: [(k.lower(), v) for k, v in dosing.items()]
+    for drug, dosing in DRUG_DOSING.items()
+}
+
+
+_RISK_MAP = {
+    "Safe": "no clinically significant pharmacogenomic risk",
+    "Adjust Dosage": "a clinically significant interaction requiring dose modification",
+    "Toxic": "HIGH RISK of drug toxicity",
+    "Ineffective": "predicted drug INEFFECTIVENESS due to pharmacogenomic factors",
+    "Unknown": "an UNKNOWN pharmacogenomic risk profile",
+}
+
+_EXPLANATION_FIELDS = ("summary", "mechanism", "guideline_reference")
+
 
 def _template_explanation(gene, phenotype, drug, detected_variants, diplotype, risk_label, clinical_action, guideline):
     """Template-based fallback explanation."""
+    return dict(zip(_EXPLANATION_FIELDS, _template_explanation_cached(
+        gene, phenotype, drug, tuple(detected_variants or ()), diplotype, risk_label, clinical_action, guideline,
+    )))
+
+
+@functools.lru_cache(maxsize=2048)
+def _template_explanation_cached(gene, phenotype, drug, detected_variants, diplotype, risk_label, clinical_action, guideline):
+    """
+    Memoised body of _template_explanation (all arguments hashable).
+    Returns a (summary, mechanism, guideline_reference) tuple.
+    """
     drug_upper = drug.upper()
     variant_text = ", ".join(detected_variants) if detected_variants else "no pathogenic variants (wildtype assumed)"
 
-    risk_map = {
-        "Safe": "no clinically significant pharmacogenomic risk",
-        "Adjust Dosage": "a clinically significant interaction requiring dose modification",
-        "Toxic": "HIGH RISK of drug toxicity",
-        "Ineffective": "predicted drug INEFFECTIVENESS due to pharmacogenomic factors",
-        "Unknown": "an UNKNOWN pharmacogenomic risk profile",
-    }
-
     summary = (
         f"This patient's {gene} genotype ({diplotype}) is classified as {phenotype}. "
         f"Detected pharmacogenomic variants: {variant_text}. "
-        f"For {drug_upper}, this phenotype predicts {risk_map.get(risk_label, 'an unclassified interaction')}. "
+        f"For {drug_upper}, this phenotype predicts {_RISK_MAP.get(risk_label, 'an unclassified interaction')}. "
         f"{clinical_action}"
     )
 
-    gene_mechs = GENE_MECHANISMS.get(gene, {})
+    pheno_lc = phenotype.lower()
     mechanism = next(
-        (v for k, v in gene_mechs.items() if k.lower() in phenotype.lower()),
+        (v for k, v in GENE_MECHANISMS_LC.get(gene, ()) if k in pheno_lc),
         f"{gene} activity is altered, affecting {drug_upper} pharmacokinetics."
     )
 
-    drug_dosing = DRUG_DOSING.get(drug_upper, {})
-    dosing = next((v for k, v in drug_dosing.items() if k.lower() in phenotype.lower()), None)
+    dosing = next((v for k, v in DRUG_DOSING_LC.get(drug_upper, ()) if k in pheno_lc), None)
     if dosing:
         mechanism += f"\n\nDosing Implication: {dosing}"
 
@@ -129,25 +160,102 @@ def _template_explanation(gene, phenotype, drug, detected_variants, diplotype, r
         else f"No specific CPIC guideline for {drug_upper}. Consult FDA Pharmacogenomic Biomarkers table."
     )
 
-    return {"summary": summary, "mechanism": mechanism, "guideline_reference": guideline_reference}
+    return summary, mechanism, guideline_reference
 
 
-def generate_explanation(gene, phenotype, drug, detected_variants, diplotype, risk_label, clinical_action, guideline):
-    """
-    Main entry point.
-    Uses Claude API if ANTHROPIC_API_KEY is set, else falls back to templates.
-    """
-    api_key = os.getenv("ANTHROPIC_API_KEY")
+# ─────────────────────────────────────────────────────────────────────────────
+# CLAUDE API
+# ─────────────────────────────────────────────────────────────────────────────
 
-    if not api_key or not ANTHROPIC_AVAILABLE:
-        logger.info("Using template-based explanation (no API key).")
-        return _template_explanation(gene, phenotype, drug, detected_variants, diplotype, risk_label, clinical_action, guideline)
+CLAUDE_MODEL = "claude-sonnet-4-20250514"
 
-    variant_text = ", ".join(detected_variants) if detected_variants else "no variants detected (wildtype)"
+# Most Claude calls one multi-drug API request keeps in flight at once.
+EXPLANATION_CONCURRENCY = 5
 
-    prompt = f"""You are a clinical pharmacogenomics expert. Generate a structured clinical explanation.
+_client = None
+_client_api_key = None
+_async_client = None
+_async_client_api_key = None
+_client_lock = threading.Lock()
+
+
+def _load_anthropic():
+    """Import the anthropic SDK on first use. Call with _client_lock held."""
+    global _anthropic
+    if _anthropic is None:
+        import anthropic
+        _anthropic = anthropic
+    return _anthropic
+
+
+def _get_client(api_key):
+    """Return a shared Anthropic client so its HTTP connection pool is reused."""
+    global _client, _client_api_key
+    with _client_lock:
+        if _client is None or _client_api_key != api_key:
+            _client = _load_anthropic().Anthropic(api_key=api_key)
+            _client_api_key = api_key
+        return _client
+
+
+def _get_async_client(api_key):
+    """Async counterpart of _get_client, used by the FastAPI endpoints."""
+    global _async_client, _async_client_api_key
+    with _client_lock:
+        if _async_client is None or _async_client_api_key != api_key:
+            _async_client = _load_anthropic().AsyncAnthropic(api_key=api_key)
+            _async_client_api_key = api_key
+        return _async_client
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# EXPLANATION CACHE
+# Claude output depends only on the prompt inputs, and identical profiles
+# (e.g. wildtype Normal Metabolizer) recur across patients. Only successful
+# API responses are cached, so a transient failure never pins a template.
+# ─────────────────────────────────────────────────────────────────────────────
+
+EXPLANATION_CACHE_SIZE = 4096
+
+_explanation_cache = OrderedDict()
+_explanation_cache_lock = threading.Lock()
+
+
+def _cache_key(gene, phenotype, drug, detected_variants, diplotype, risk_label, clinical_action, guideline):
+    return (gene, phenotype, drug, tuple(detected_variants or ()), diplotype, risk_label, clinical_action, guideline)
+
+
+def _cache_get(key):
+    with _explanation_cache_lock:
+        fields = _explanation_cache.get(key)
+        if fields is None:
+            return None
+        _explanation_cache.move_to_end(key)
+    return dict(zip(_EXPLANATION_FIELDS, fields))
+
+
+def _cache_put(key, explanation):
+    with _explanation_cache_lock:
+        _explanation_cache[key] = tuple(explanation[f] for f in _EXPLANATION_FIELDS)
+        _explanation_cache.move_to_end(key)
+        if len(_explanation_cache) > EXPLANATION_CACHE_SIZE:
+            _explanation_cache.popitem(last=False)
+
+
+# The role and output schema are identical for every call, so they go in the
+# system prompt; only the patient data varies. (At ~200 tokens it is below the
+# minimum cacheable prefix, so it is not marked for prompt caching.)
+_SYSTEM_PROMPT = """You are a clinical pharmacogenomics expert. For each request, generate a structured clinical explanation of the patient data provided.
+
+Respond ONLY with a valid JSON object with exactly these 3 keys (no markdown, no extra text):
+
+{
+  "summary": "2-3 sentences: state genotype, phenotype, detected variants, and predicted risk for this drug.",
+  "mechanism": "3-4 sentences: explain biological mechanism — enzyme/transporter function, molecular consequence of variant, effect on drug plasma levels or efficacy. Include specific dosing implication.",
+  "guideline_reference": "1-2 sentences: cite the specific CPIC/DPWG guideline, recommendation strength, and where to find full guidance."
+}"""
 
-Patient Data:
+_PROMPT_TEMPLATE = """Patient Data:
 - Gene: {gene}
 - Diplotype: {diplotype}
 - Phenotype: {phenotype}
@@ -155,31 +263,133 @@ Patient Data:
 - Detected Variants: {variant_text}
 - Risk Assessment: {risk_label}
 - Clinical Action: {clinical_action}
-- Guideline: {guideline}
+- Guideline: {guideline}"""
 
-Respond ONLY with a valid JSON object with exactly these 3 keys (no markdown, no extra text):
 
-{{
-  "summary": "2-3 sentences: state genotype, phenotype, detected variants, and predicted risk for this drug.",
-  "mechanism": "3-4 sentences: explain biological mechanism — enzyme/transporter function, molecular consequence of variant, effect on drug plasma levels or efficacy. Include specific dosing implication.",
-  "guideline_reference": "1-2 sentences: cite the specific CPIC/DPWG guideline, recommendation strength, and where to find full guidance."
-}}"""
+def _build_prompt(gene, phenotype, drug, detected_variants, diplotype, risk_label, clinical_action, guideline):
+    """Render the per-request (user) part of the Claude prompt for one gene/drug pair."""
+    return _PROMPT_TEMPLATE.format_map({
+        "gene":            gene,
+        "diplotype":       diplotype,
+        "phenotype":       phenotype,
+        "drug":            drug,
+        "variant_text":    ", ".join(detected_variants) if detected_variants else "no variants detected (wildtype)",
+        "risk_label":      risk_label,
+        "clinical_action": clinical_action,
+        "guideline":       guideline,
+    })
 
-    try:
-        client = anthropic.Anthropic(api_key=api_key)
-        message = client.messages.create(
-            model="claude-opus-4-6",
-            max_tokens=1024,
-            messages=[{"role": "user", "content": prompt}]
+
+def _message_params(prompt):
+    """Keyword arguments for messages.create."""
+    return {
+        "model":      CLAUDE_MODEL,
+        "max_tokens": 1024,
+        "system":     _SYSTEM_PROMPT,
+        "messages":   [{"role": "user", "content": prompt}],
+    }
+
+
+def _parse_message(message):
+    """Extract the three explanation fields from a Claude response message."""
+    usage = getattr(message, "usage", None)
+    if usage is not None:
+        logger.info(
+            "Claude usage: input=%s output=%s",
+            getattr(usage, "input_tokens", None),
+            getattr(usage, "output_tokens", None),
         )
-        import json
-        text = message.content[0].text.strip().replace("```json", "").replace("```", "").strip()
-        parsed = json.loads(text)
-        return {
-            "summary":             parsed.get("summary", ""),
-            "mechanism":           parsed.get("mechanism", ""),
-            "guideline_reference": parsed.get("guideline_reference", ""),
-        }
+    text = message.content[0].text.strip().replace("```json", "").replace("```", "").strip()
+    parsed = orjson.loads(text)
+    return {
+        "summary":             parsed.get("summary", ""),
+        "mechanism":           parsed.get("mechanism", ""),
+        "guideline_reference": parsed.get("guideline_reference", ""),
+    }
+
+
+def _explanation_request(gene, phenotype, drug, detected_variants, diplotype, risk_label, clinical_action, guideline):
+    """Bundle the explanation inputs into the keyword dict the helpers below share."""
+    return {
+        "gene":              gene,
+        "phenotype":         phenotype,
+        "drug":              drug,
+        "detected_variants": detected_variants,
+        "diplotype":         diplotype,
+        "risk_label":        risk_label,
+        "clinical_action":   clinical_action,
+        "guideline":         guideline,
+    }
+
+
+def _ready_explanation(api_key, request):
+    """
+    The explanation when no Claude call is needed: the template when there is
+    no API key, or a cached response. None means the caller must call Claude.
+    """
+    if not api_key or not ANTHROPIC_AVAILABLE:
+        logger.info("Using template-based explanation (no API key).")
+        return _template_explanation(**request)
+    return _cache_get(_cache_key(**request))
+
+
+def _finish_explanation(request, message):
+    """Parse a Claude response and cache it (only successful responses are cached)."""
+    explanation = _parse_message(message)
+    _cache_put(_cache_key(**request), explanation)
+    return explanation
+
+
+def _fallback_explanation(request, error):
+    logger.error("Claude API failed: %s — using template fallback.", error)
+    return _template_explanation(**request)
+
+
+def generate_explanation(gene, phenotype, drug, detected_variants, diplotype, risk_label, clinical_action, guideline):
+    """
+    Main entry point.
+    Uses Claude API if ANTHROPIC_API_KEY is set, else falls back to templates.
+    """
+    api_key = os.getenv("ANTHROPIC_API_KEY")
+    request = _explanation_request(gene, phenotype, drug, detected_variants, diplotype, risk_label, clinical_action, guideline)
+    explanation = _ready_explanation(api_key, request)
+    if explanation:
+        return explanation
+
+    try:
+        message = _get_client(api_key).messages.create(**_message_params(_build_prompt(**request)))
+        return _finish_explanation(request, message)
+    except Exception as e:
+        return _fallback_explanation(request, e)
+
+
+async def generate_explanation_async(gene, phenotype, drug, detected_variants, diplotype, risk_label, clinical_action, guideline):
+    """Non-blocking generate_explanation for use inside the async API handlers."""
+    api_key = os.getenv("ANTHROPIC_API_KEY")
+    request = _explanation_request(gene, phenotype, drug, detected_variants, diplotype, risk_label, clinical_action, guideline)
+    explanation = _ready_explanation(api_key, request)
+    if explanation:
+        return explanation
+
+    try:
+        message = await _get_async_client(api_key).messages.create(**_message_params(_build_prompt(**request)))
+        return _finish_explanation(request, message)
     except Exception as e:
-        logger.error("Claude API failed: %s — using template fallback.", e)
-        return _template_explanation(gene, phenotype, drug, detected_variants, diplotype, risk_label, clinical_action, guideline)
\ No newline at end of file
+        return _fallback_explanation(request, e)
+
+
+async def generate_explanations_async(requests):
+    """
+    Generate explanations for several drugs without blocking the event loop.
+
+    Each item in `requests` is a dict of generate_explanation keyword arguments;
+    results are returned in the same order. Calls run concurrently, at most
+    EXPLANATION_CONCURRENCY at a time.
+    """
+    semaphore = asyncio.Semaphore(EXPLANATION_CONCURRENCY)
+
+    async def bounded(request):
+        async with semaphore:
+            return await generate_explanation_async(**request)
+
+    return list(await asyncio.gather(*(bounded(r) for r in requests)))
@@ -7,16 +7,23 @@ Endpoints:
   POST /upload-vcf       — Upload and parse a VCF file
   POST /analyze          — Full pharmacogenomic risk analysis
   POST /analyze-batch    — Analyse multiple drugs at once
+
+Request bodies may be sent with Content-Encoding: gzip (e.g. a gzipped
+multipart VCF upload); they are decompressed transparently on arrival.
 """
 
 # rift26-hackathon\ML\main.py
 
 import os
 import uuid
+import zlib
+import asyncio
+import operator
 import logging
 import tempfile
 from dotenv import load_dotenv
-load_dotenv()  # Loads ANTHROPIC_API_KEY from .env file
+if "ANTHROPIC_API_KEY" not in os.environ:
+    load_dotenv()  # Loads ANTHROPIC_API_KEY from .env file
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional, Union
@@ -25,12 +32,14 @@ from fastapi import FastAPI, File, Form, UploadFile, HTTPException, BackgroundTa
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+import orjson
 
 # Internal modules
 from vcf_parser      import parse_vcf, group_variants_by_gene
 from phenotype_mapper import map_phenotypes
-from pgx_rules        import assess_drug_risk, assess_multiple_drugs
-from llm_explainer    import generate_explanation
+from pgx_rules        import RiskResult, assess_drug_risk, assess_multiple_drugs
+from llm_explainer    import generate_explanation_async, generate_explanations_async
+from session_store    import SessionStore
 
 # ─────────────────────────────────────────────────────────────────────────────
 logging.basicConfig(
@@ -40,7 +49,80 @@ logging.basicConfig(
 logger = logging.getLogger("pharmaguard")
 
 # ─────────────────────────────────────────────────────────────────────────────
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson (C encoder) — /analyze payloads are large."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+
+# Upper bound on a gzip-encoded request body once inflated (1 GiB), and
+# the most that is inflated per receive() call (1 MB)
+MAX_DECOMPRESSED_BODY = 1 << 30
+INFLATE_CHUNK_SIZE    = 1 << 20
+
+
+class GzipRequestMiddleware:
+    """
+    ASGI middleware that inflates request bodies sent with
+    Content-Encoding: gzip, chunk by chunk as they arrive, so the rest of the
+    app sees a plain body. Other encodings are passed through untouched.
+    A corrupt gzip stream surfaces as FastAPI's 400 body-parsing error, and a
+    body that inflates past MAX_DECOMPRESSED_BODY is rejected with 413.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        encoding = next((v for k, v in scope["headers"] if k == b"content-encoding"), b"")
+        if encoding.strip().lower() != b"gzip":
+            return await self.app(scope, receive, send)
+
+        # The inflated body has a different length and no encoding.
+        scope = dict(scope)
+        scope["headers"] = [
+            (k, v) for k, v in scope["headers"]
+            if k not in (b"content-encoding", b"content-length")
+        ]
+        inflater  = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        inflated  = 0
+        pending   = b""     # compressed input not yet inflated
+        more_body = True    # whether the client has more chunks to send
+
+        async def inflating_receive():
+            # Each call inflates at most INFLATE_CHUNK_SIZE bytes; leftover
+            # input is handed out on later calls, so a small compressed
+            # message never expands into one huge buffer.
+            nonlocal inflated, pending, more_body
+            if not pending:
+                message = await receive()
+                if message["type"] != "http.request":
+                    return message
+                pending   = message.get("body", b"")
+                more_body = message.get("more_body", False)
+
+            body    = inflater.decompress(pending, INFLATE_CHUNK_SIZE)
+            pending = inflater.unconsumed_tail
+            if not pending and not more_body:
+                body += inflater.flush()
+
+            inflated += len(body)
+            if inflated > MAX_DECOMPRESSED_BODY:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Decompressed request body exceeds {MAX_DECOMPRESSED_BODY} bytes.",
+                )
+            return {"type": "http.request", "body": body, "more_body": bool(pending) or more_body}
+
+        await self.app(scope, inflating_receive, send)
+
+
 app = FastAPI(
+    default_response_class=ORJSONResponse,
     title="PharmaGuard — Pharmacogenomic Risk Prediction API",
     description=(
         "Parses patient VCF files, maps pharmacogenomic variants to diplotypes, "
@@ -52,21 +134,35 @@ app = FastAPI(
     redoc_url="/redoc",
 )
 
+# Comma-separated list of frontend origins allowed to call the API
+# (defaults to the Next.js dev server).
+CORS_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",")
+    if origin.strip()
+]
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type", "content-encoding", "authorization"],
 )
+app.add_middleware(GzipRequestMiddleware)
 
-# Temporary storage for uploaded VCF sessions (in-memory for hackathon)
-# In production this would be a database or object storage.
-vcf_sessions: dict[str, dict] = {}
+# Uploaded VCF sessions — Redis when REDIS_URL is set (shared across
+# workers), otherwise a bounded in-process store. Both expire after 1 hour.
+vcf_sessions = SessionStore(os.getenv("REDIS_URL"))
 
 UPLOAD_DIR = Path(tempfile.gettempdir()) / "pharmaguard_uploads"
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MB
+
+# Accepted upload suffixes, longest first (all lowercase)
+_VCF_SUFFIXES = (".vcf.bgz", ".vcf.gz", ".vcf")
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # REQUEST / RESPONSE MODELS
@@ -84,55 +180,101 @@ class HealthResponse(BaseModel):
     timestamp: str
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# HELPER: validate and stream an uploaded VCF to disk
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _vcf_suffix(filename: Optional[str]) -> Optional[str]:
+    """
+    Return the matching entry of _VCF_SUFFIXES for an upload filename, or None
+    if it is not a VCF. Only the tail is lowercased, not the whole name.
+    """
+    if not filename:
+        return None
+    tail = filename[-len(_VCF_SUFFIXES[0]):].lower()
+    return next((sfx for sfx in _VCF_SUFFIXES if tail.endswith(sfx)), None)
+
+
+async def _save_upload(file: UploadFile, save_path: Path) -> int:
+    """
+    Copy an upload to disk in UPLOAD_CHUNK_SIZE pieces so large VCFs are
+    never held in memory whole. Returns the number of bytes written.
+    """
+    with open(save_path, "wb") as out:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            out.write(chunk)
+    return save_path.stat().st_size
+
+
+def _group_and_map(parsed: dict) -> tuple[dict, dict]:
+    """Group parsed variants by gene and map phenotypes (run off the event loop)."""
+    grouped = group_variants_by_gene(parsed["variants"])
+    return grouped, map_phenotypes(grouped)
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # HELPER: build the full analysis JSON for a single drug
 # ─────────────────────────────────────────────────────────────────────────────
 
-def _build_analysis_response(
+# Per-variant fields echoed in pharmacogenomic_profile.detected_variants.
+# parse_vcf always sets every one of these keys, so a C-level itemgetter
+# can replace nine dict.get calls per variant.
+_VARIANT_KEYS = (
+    "rsid", "gene", "chromosome", "position", "ref",
+    "alt", "genotype", "zygosity", "star_allele",
+)
+_variant_getter = operator.itemgetter(*_VARIANT_KEYS)
+
+
+def _explanation_request(risk: RiskResult, drug: str, phenotype_profile: dict) -> dict:
+    """Keyword arguments for generate_explanation for one assessed drug."""
+    gene_data = phenotype_profile.get(risk.primary_gene, {})
+    return {
+        "gene":              risk.primary_gene,
+        "phenotype":         risk.phenotype,
+        "drug":              drug,
+        "detected_variants": [
+            v.get("rsid") for v in gene_data.get("raw_variants", [])
+            if v.get("rsid")
+        ],
+        "diplotype":         risk.diplotype,
+        "risk_label":        risk.risk_label,
+        "clinical_action":   risk.clinical_action,
+        "guideline":         risk.guideline,
+    }
+
+
+async def _build_analysis_response(
     patient_id: str,
     drug: str,
     parsed_vcf: dict,
     phenotype_profile: dict,
+    risk: Optional[RiskResult] = None,
+    explanation: Optional[dict] = None,
+    timestamp: Optional[str] = None,
 ) -> dict:
     """
     Orchestrates the full pipeline for one drug and returns the
     structured JSON matching the PharmaGuard output schema.
+
+    `risk` and `explanation` may be precomputed by the caller (multi-drug
+    requests fetch all explanations together); otherwise they are computed here.
+    `timestamp` lets every drug in one request share the same time stamp.
     """
     # 1. Drug risk assessment
-    risk = assess_drug_risk(drug, phenotype_profile)
+    if risk is None:
+        risk = assess_drug_risk(drug, phenotype_profile)
 
     # 2. Gene profile for primary gene
     gene_data = phenotype_profile.get(risk.primary_gene, {})
-    detected_variants_rsids = [
-        v.get("rsid") for v in gene_data.get("raw_variants", [])
-        if v.get("rsid")
-    ]
     detected_variants_full = [
-        {
-            "rsid":         v.get("rsid"),
-            "gene":         v.get("gene"),
-            "chromosome":   v.get("chromosome"),
-            "position":     v.get("position"),
-            "ref":          v.get("ref"),
-            "alt":          v.get("alt"),
-            "genotype":     v.get("genotype"),
-            "zygosity":     v.get("zygosity"),
-            "star_allele":  v.get("star_allele"),
-        }
+        dict(zip(_VARIANT_KEYS, _variant_getter(v)))
         for v in gene_data.get("raw_variants", [])
     ]
 
     # 3. LLM explanation
-    explanation = generate_explanation(
-        gene=risk.primary_gene,
-        phenotype=risk.phenotype,
-        drug=drug,
-        detected_variants=detected_variants_rsids,
-        diplotype=risk.diplotype,
-        risk_label=risk.risk_label,
-        clinical_action=risk.clinical_action,
-        guideline=risk.guideline,
-    )
+    if explanation is None:
+        explanation = await generate_explanation_async(**_explanation_request(risk, drug, phenotype_profile))
 
     # 4. Clinical recommendation block
     clinical_recommendation = {
@@ -148,7 +290,7 @@ def _build_analysis_response(
     return {
         "patient_id":   patient_id,
         "drug":         risk.drug,
-        "timestamp":    datetime.now(timezone.utc).isoformat(),
+        "timestamp":    timestamp or datetime.now(timezone.utc).isoformat(),
 
         "risk_assessment": {
             "risk_label":       risk.risk_label,
@@ -172,15 +314,41 @@ def _build_analysis_response(
             "total_variants_parsed":  parsed_vcf.get("total_variants_parsed", 0),
             "pgx_variants_found":     parsed_vcf.get("pgx_variants_found", 0),
             "parse_errors":           parsed_vcf.get("parse_errors", []),
-            "genes_with_variants":    [
-                g for g, variants in group_variants_by_gene(
-                    parsed_vcf.get("variants", [])
-                ).items() if variants
-            ],
+            # raw_variants is each gene's group_variants_by_gene list
+            "genes_with_variants":    [g for g, data in phenotype_profile.items() if data.get("raw_variants")],
         },
     }
 
 
+async def _build_multi_drug_responses(
+    patient_id: str,
+    drugs: list[str],
+    parsed_vcf: dict,
+    phenotype_profile: dict,
+    timestamp: str,
+) -> list[dict]:
+    """
+    Multi-drug variant of _build_analysis_response: all explanations are
+    requested concurrently instead of as N serial Claude calls. The Message
+    Batches API is deliberately not used here — its minutes of turnaround
+    would hold the HTTP response open.
+    Rule evaluation is a few dict lookups per drug, so it runs inline, with
+    the phenotype profile prepared once for all drugs.
+    """
+    risks = assess_multiple_drugs(drugs, phenotype_profile)
+    explanations = await generate_explanations_async([
+        _explanation_request(risk, drug, phenotype_profile)
+        for drug, risk in zip(drugs, risks)
+    ])
+    return [
+        await _build_analysis_response(
+            patient_id, drug, parsed_vcf, phenotype_profile,
+            risk=risk, explanation=explanation, timestamp=timestamp,
+        )
+        for drug, risk, explanation in zip(drugs, risks, explanations)
+    ]
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # ENDPOINTS
 # ─────────────────────────────────────────────────────────────────────────────
@@ -203,51 +371,56 @@ async def upload_vcf(
     Upload a patient VCF file.
     Returns a session_id that must be passed to /analyze.
 
-    - Accepts: multipart/form-data with a VCF file
+    - Accepts: multipart/form-data with a VCF file (body may be gzip-encoded)
     - Returns: session_id, sample_id, variant summary
     """
     # Validate file extension
-    if not file.filename.lower().endswith((".vcf", ".vcf.gz")):
+    suffix = _vcf_suffix(file.filename)
+    if suffix is None:
         raise HTTPException(
             status_code=400,
             detail="Only .vcf files are supported. Please upload a standard VCF file."
         )
 
-    # Save to temp storage
+    # Save to temp storage (keep .gz / .bgz so the parser decompresses it)
     session_id = str(uuid.uuid4())
-    save_path  = UPLOAD_DIR / f"{session_id}.vcf"
+    save_path  = UPLOAD_DIR / f"{session_id}{suffix}"
 
     try:
-        content = await file.read()
-        with open(save_path, "wb") as f:
-            f.write(content)
+        size = await _save_upload(file, save_path)
         logger.info("VCF uploaded: session=%s file=%s size=%d bytes",
-                    session_id, file.filename, len(content))
+                    session_id, file.filename, size)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"File upload failed: {str(exc)}")
 
-    # Parse VCF immediately to validate and extract basic info
+    # Parse VCF immediately to validate and extract basic info.
+    # Parsing is CPU-bound, so it runs on a worker thread to keep the
+    # event loop free for other requests.
     try:
-        parsed = parse_vcf(str(save_path))
+        parsed = await asyncio.to_thread(parse_vcf, str(save_path))
     except Exception as exc:
         os.remove(save_path)
         raise HTTPException(status_code=422, detail=f"VCF parsing failed: {str(exc)}")
 
-    # Store in session
-    vcf_sessions[session_id] = {
-        "path":   str(save_path),
-        "parsed": parsed,
-    }
+    # Store in session only what /analyze reads: the parse metadata and the
+    # phenotype profile, so it is not recomputed for every drug query. The
+    # profile's raw_variants already hold every PGx variant, so the variant
+    # list itself (and its per-gene grouping) is not stored a second time.
+    grouped, phenotype_profile = await asyncio.to_thread(_group_and_map, parsed)
+    await vcf_sessions.set(session_id, {
+        "path":              str(save_path),
+        "parsed":            {k: v for k, v in parsed.items() if k != "variants"},
+        "phenotype_profile": phenotype_profile,
+    })
 
     # Gene-level variant summary
-    grouped = group_variants_by_gene(parsed["variants"])
     gene_summary = {
         gene: len(variants)
         for gene, variants in grouped.items()
         if variants
     }
 
-    return JSONResponse(content={
+    return ORJSONResponse({
         "session_id":             session_id,
         "sample_id":              parsed["sample_id"],
         "filename":               file.filename,
@@ -276,7 +449,7 @@ async def analyze(request: AnalyzeRequest):
     SIMVASTATIN, AZATHIOPRINE, FLUOROURACIL, CAPECITABINE,
     TRAMADOL, PHENYTOIN, AMITRIPTYLINE, CITALOPRAM, and more.
     """
-    session = vcf_sessions.get(request.session_id)
+    session = await vcf_sessions.get(request.session_id)
     if not session:
         raise HTTPException(
             status_code=404,
@@ -286,27 +459,30 @@ async def analyze(request: AnalyzeRequest):
             )
         )
 
-    parsed          = session["parsed"]
-    grouped         = group_variants_by_gene(parsed["variants"])
-    phenotype_profile = map_phenotypes(grouped)
-    patient_id      = request.patient_id or parsed["sample_id"]
+    parsed            = session["parsed"]
+    phenotype_profile = session["phenotype_profile"]
+    patient_id        = request.patient_id or parsed["sample_id"]
 
     # Handle single drug or list
     drugs = request.drug if isinstance(request.drug, list) else [request.drug]
+    timestamp = datetime.now(timezone.utc).isoformat()
 
     if len(drugs) == 1:
         # Return single analysis
-        result = _build_analysis_response(patient_id, drugs[0], parsed, phenotype_profile)
-        return JSONResponse(content=result)
+        result = await _build_analysis_response(
+            patient_id, drugs[0], parsed, phenotype_profile,
+            timestamp=timestamp,
+        )
+        return ORJSONResponse(result)
 
     # Multiple drugs — return list
-    results = []
-    for drug in drugs:
-        results.append(_build_analysis_response(patient_id, drug, parsed, phenotype_profile))
+    results = await _build_multi_drug_responses(
+        patient_id, drugs, parsed, phenotype_profile, timestamp,
+    )
 
-    return JSONResponse(content={
+    return ORJSONResponse({
         "patient_id":   patient_id,
-        "timestamp":    datetime.now(timezone.utc).isoformat(),
+        "timestamp":    timestamp,
         "drug_count":   len(results),
         "analyses":     results,
     })
@@ -323,50 +499,54 @@ async def analyze_file(
     Convenience endpoint for hackathon demos.
     """
     # Re-use upload logic
-    if not file.filename.lower().endswith((".vcf", ".vcf.gz")):
+    suffix = _vcf_suffix(file.filename)
+    if suffix is None:
         raise HTTPException(status_code=400, detail="Only .vcf files are supported.")
 
     session_id = str(uuid.uuid4())
-    save_path  = UPLOAD_DIR / f"{session_id}.vcf"
+    save_path  = UPLOAD_DIR / f"{session_id}{suffix}"
 
-    content = await file.read()
-    with open(save_path, "wb") as f:
-        f.write(content)
+    await _save_upload(file, save_path)
 
     try:
-        parsed = parse_vcf(str(save_path))
+        parsed = await asyncio.to_thread(parse_vcf, str(save_path))
     except Exception as exc:
         raise HTTPException(status_code=422, detail=f"VCF parsing failed: {str(exc)}")
 
-    grouped           = group_variants_by_gene(parsed["variants"])
-    phenotype_profile = map_phenotypes(grouped)
-    pid               = patient_id or parsed["sample_id"]
+    _, phenotype_profile       = await asyncio.to_thread(_group_and_map, parsed)
+    pid                        = patient_id or parsed["sample_id"]
 
-    drugs = [d.strip() for d in drug.split(",")]
+    drugs     = [d.strip() for d in drug.split(",")]
+    timestamp = datetime.now(timezone.utc).isoformat()
 
     if len(drugs) == 1:
-        result = _build_analysis_response(pid, drugs[0], parsed, phenotype_profile)
+        result = await _build_analysis_response(
+            pid, drugs[0], parsed, phenotype_profile,
+            timestamp=timestamp,
+        )
     else:
         result = {
             "patient_id": pid,
-            "timestamp":  datetime.now(timezone.utc).isoformat(),
+            "timestamp":  timestamp,
             "drug_count": len(drugs),
-            "analyses":   [_build_analysis_response(pid, d, parsed, phenotype_profile) for d in drugs],
+            "analyses":   await _build_multi_drug_responses(
+                pid, drugs, parsed, phenotype_profile, timestamp,
+            ),
         }
 
-    return JSONResponse(content=result)
+    return ORJSONResponse(result)
 
 
 @app.get("/supported-drugs", tags=["Reference"])
 async def supported_drugs():
     """List all drugs with pharmacogenomic rules in the PharmaGuard database."""
-    from pgx_rules import DRUG_RULES, DRUG_PRIMARY_GENE
+    from pgx_rules import DRUG_RULES, DRUG_PRIMARY_GENE, DRUG_DEFAULT_SAFE
     return {
         "supported_drugs": [
             {
                 "drug":         drug,
                 "primary_gene": DRUG_PRIMARY_GENE.get(drug, "Unknown"),
-                "rule_count":   len(rules),
+                "rule_count":   len(rules) + (drug in DRUG_DEFAULT_SAFE),
             }
             for drug, rules in DRUG_RULES.items()
         ],
@@ -17,29 +17,32 @@ Abbreviations PM/NM/IM are applied ONLY in main.py for JSON output.
 
 # rift26-hackathon\ML\pgx_rules.py
 
+import sys
 import logging
-from dataclasses import dataclass, field
-from typing import Optional
+import functools
+from types import MappingProxyType
+from dataclasses import dataclass
+from typing import Callable, Optional
 
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+@dataclass(slots=True)
 class RiskResult:
     """Container for a single drug risk assessment."""
     drug:              str
-    risk_label:        str           # Safe | Adjust Dosage | Toxic | Ineffective | Unknown
-    severity:          str           # none | low | moderate | high | critical
-    confidence_score:  float         # 0.0 – 1.0
+    risk_label:        str              # Safe | Adjust Dosage | Toxic | Ineffective | Unknown
+    severity:          str              # none | low | moderate | high | critical
+    confidence_score:  float            # 0.0 – 1.0
     primary_gene:      str
     phenotype:         str
     diplotype:         str
-    detected_variants: list[str]     = field(default_factory=list)
-    clinical_action:   str           = ""
-    alternative_drugs: list[str]     = field(default_factory=list)
-    dose_adjustment:   Optional[str] = None
-    monitoring:        Optional[str] = None
-    guideline:         str           = ""
+    detected_variants: tuple[str, ...] = ()
+    clinical_action:   str              = ""
+    alternative_drugs: tuple[str, ...] = ()
+    dose_adjustment:   Optional[str]    = None
+    monitoring:        Optional[str]    = None
+    guideline:         str              = ""
 
 
 DRUG_RULES: dict[str, list[dict]] = {
@@ -77,15 +80,6 @@ DRUG_RULES: dict[str, list[dict]] = {
             "dose_adjustment": "Consider dose increase with caution or switch to non-CYP2D6-metabolised opioid.",
             "guideline": "CPIC guideline for codeine and CYP2D6 (2014, updated 2022)",
         },
-        {
-            "gene": "CYP2D6",
-            "phenotype_match": ["Normal Metabolizer"],
-            "risk_label": "Safe",
-            "severity": "none",
-            "confidence": 0.90,
-            "clinical_action": "Use label-recommended dosing.",
-            "guideline": "CPIC guideline for codeine and CYP2D6 (2014, updated 2022)",
-        },
     ],
 
     "TRAMADOL": [
@@ -118,15 +112,6 @@ DRUG_RULES: dict[str, list[dict]] = {
             "clinical_action": "Mildly reduced tramadol activation. Monitor analgesic response.",
             "guideline": "CPIC guideline for tramadol and CYP2D6 (2021)",
         },
-        {
-            "gene": "CYP2D6",
-            "phenotype_match": ["Normal Metabolizer"],
-            "risk_label": "Safe",
-            "severity": "none",
-            "confidence": 0.88,
-            "clinical_action": "Use label-recommended dosing.",
-            "guideline": "CPIC guideline for tramadol and CYP2D6 (2021)",
-        },
     ],
 
     # ── ANTICOAGULANTS ────────────────────────────────────────────────────────
@@ -153,15 +138,6 @@ DRUG_RULES: dict[str, list[dict]] = {
             "monitoring": "Weekly INR for first month.",
             "guideline": "CPIC guideline for warfarin, CYP2C9, VKORC1, CYP4F2 (2017)",
         },
-        {
-            "gene": "CYP2C9",
-            "phenotype_match": ["Normal Metabolizer"],
-            "risk_label": "Safe",
-            "severity": "none",
-            "confidence": 0.85,
-            "clinical_action": "Use standard label dosing. Routine INR monitoring.",
-            "guideline": "CPIC guideline for warfarin, CYP2C9, VKORC1, CYP4F2 (2017)",
-        },
     ],
 
     "PHENYTOIN": [
@@ -185,15 +161,6 @@ DRUG_RULES: dict[str, list[dict]] = {
             "dose_adjustment": "Reduce dose by 25%.",
             "guideline": "CPIC guideline for phenytoin and CYP2C9, HLA-B (2020)",
         },
-        {
-            "gene": "CYP2C9",
-            "phenotype_match": ["Normal Metabolizer"],
-            "risk_label": "Safe",
-            "severity": "none",
-            "confidence": 0.87,
-            "clinical_action": "Standard dosing. Routine serum level monitoring.",
-            "guideline": "CPIC guideline for phenytoin and CYP2C9, HLA-B (2020)",
-        },
     ],
 
     # ── ANTIPLATELET ──────────────────────────────────────────────────────────
@@ -227,15 +194,6 @@ DRUG_RULES: dict[str, list[dict]] = {
             "clinical_action": "Enhanced clopidogrel activation. Use label-recommended dosing.",
             "guideline": "CPIC guideline for clopidogrel and CYP2C19 (2013, updated 2022)",
         },
-        {
-            "gene": "CYP2C19",
-            "phenotype_match": ["Normal Metabolizer"],
-            "risk_label": "Safe",
-            "severity": "none",
-            "confidence": 0.90,
-            "clinical_action": "Standard clopidogrel dosing recommended.",
-            "guideline": "CPIC guideline for clopidogrel and CYP2C19 (2013, updated 2022)",
-        },
     ],
 
     # ── STATINS ───────────────────────────────────────────────────────────────
@@ -320,15 +278,6 @@ DRUG_RULES: dict[str, list[dict]] = {
             "monitoring": "CBC every 2 weeks for first 3 months.",
             "guideline": "CPIC guideline for thiopurines and TPMT, NUDT15 (2018, updated 2021)",
         },
-        {
-            "gene": "TPMT",
-            "phenotype_match": ["Normal Metabolizer"],
-            "risk_label": "Safe",
-            "severity": "none",
-            "confidence": 0.88,
-            "clinical_action": "Standard dosing. Routine CBC monitoring per label.",
-            "guideline": "CPIC guideline for thiopurines and TPMT, NUDT15 (2018, updated 2021)",
-        },
     ],
 
     "MERCAPTOPURINE": [
@@ -352,15 +301,6 @@ DRUG_RULES: dict[str, list[dict]] = {
             "dose_adjustment": "Reduce dose by 30–70%.",
             "guideline": "CPIC guideline for thiopurines and TPMT, NUDT15 (2018, updated 2021)",
         },
-        {
-            "gene": "TPMT",
-            "phenotype_match": ["Normal Metabolizer"],
-            "risk_label": "Safe",
-            "severity": "none",
-            "confidence": 0.88,
-            "clinical_action": "Standard dosing.",
-            "guideline": "CPIC guideline for thiopurines and TPMT, NUDT15 (2018, updated 2021)",
-        },
     ],
 
     "THIOGUANINE": [
@@ -384,15 +324,6 @@ DRUG_RULES: dict[str, list[dict]] = {
             "dose_adjustment": "Reduce dose by 30–50%.",
             "guideline": "CPIC guideline for thiopurines and TPMT, NUDT15 (2018, updated 2021)",
         },
-        {
-            "gene": "TPMT",
-            "phenotype_match": ["Normal Metabolizer"],
-            "risk_label": "Safe",
-            "severity": "none",
-            "confidence": 0.88,
-            "clinical_action": "Standard dosing.",
-            "guideline": "CPIC guideline for thiopurines and TPMT, NUDT15 (2018, updated 2021)",
-        },
     ],
 
     # ── FLUOROPYRIMIDINES ─────────────────────────────────────────────────────
@@ -418,15 +349,6 @@ DRUG_RULES: dict[str, list[dict]] = {
             "monitoring": "CBC, LFTs, and toxicity assessment each cycle.",
             "guideline": "CPIC guideline for fluoropyrimidines and DPYD (2017, updated 2022); EMA recommendation",
         },
-        {
-            "gene": "DPYD",
-            "phenotype_match": ["Normal Metabolizer"],
-            "risk_label": "Safe",
-            "severity": "none",
-            "confidence": 0.88,
-            "clinical_action": "Standard dosing per oncology protocol.",
-            "guideline": "CPIC guideline for fluoropyrimidines and DPYD (2017, updated 2022)",
-        },
     ],
 
     "CAPECITABINE": [
@@ -449,15 +371,6 @@ DRUG_RULES: dict[str, list[dict]] = {
             "dose_adjustment": "Start at 50% of standard dose.",
             "guideline": "CPIC guideline for fluoropyrimidines and DPYD (2017, updated 2022)",
         },
-        {
-            "gene": "DPYD",
-            "phenotype_match": ["Normal Metabolizer"],
-            "risk_label": "Safe",
-            "severity": "none",
-            "confidence": 0.88,
-            "clinical_action": "Standard dosing.",
-            "guideline": "CPIC guideline for fluoropyrimidines and DPYD (2017, updated 2022)",
-        },
     ],
 
     # ── ANTIDEPRESSANTS ───────────────────────────────────────────────────────
@@ -493,15 +406,6 @@ DRUG_RULES: dict[str, list[dict]] = {
             "dose_adjustment": "Reduce dose by 25%.",
             "guideline": "CPIC guideline for tricyclic antidepressants and CYP2D6, CYP2C19 (2016)",
         },
-        {
-            "gene": "CYP2D6",
-            "phenotype_match": ["Normal Metabolizer"],
-            "risk_label": "Safe",
-            "severity": "none",
-            "confidence": 0.87,
-            "clinical_action": "Standard dosing.",
-            "guideline": "CPIC guideline for tricyclic antidepressants and CYP2D6, CYP2C19 (2016)",
-        },
     ],
 
     "CITALOPRAM": [
@@ -526,15 +430,6 @@ DRUG_RULES: dict[str, list[dict]] = {
             "alternatives": ["Sertraline", "Mirtazapine"],
             "guideline": "CPIC guideline for SSRIs and CYP2C19 (2015)",
         },
-        {
-            "gene": "CYP2C19",
-            "phenotype_match": ["Normal Metabolizer"],
-            "risk_label": "Safe",
-            "severity": "none",
-            "confidence": 0.88,
-            "clinical_action": "Standard dosing.",
-            "guideline": "CPIC guideline for SSRIs and CYP2C19 (2015)",
-        },
         {
             "gene": "CYP2C19",
             "phenotype_match": ["Rapid Metabolizer"],
@@ -592,6 +487,104 @@ DRUG_RULES: dict[str, list[dict]] = {
     ],
 }
 
+# ─────────────────────────────────────────────────────────────────────────────
+# DEFAULT "NORMAL METABOLIZER → SAFE" RULES
+# Applied when a Normal Metabolizer on the drug's primary gene matches none of
+# the priority rules above.
+# ─────────────────────────────────────────────────────────────────────────────
+DRUG_DEFAULT_SAFE: dict[str, dict] = {
+    "CODEINE": {
+        "confidence": 0.90,
+        "clinical_action": "Use label-recommended dosing.",
+        "guideline": "CPIC guideline for codeine and CYP2D6 (2014, updated 2022)",
+    },
+    "TRAMADOL": {
+        "confidence": 0.88,
+        "clinical_action": "Use label-recommended dosing.",
+        "guideline": "CPIC guideline for tramadol and CYP2D6 (2021)",
+    },
+    "WARFARIN": {
+        "confidence": 0.85,
+        "clinical_action": "Use standard label dosing. Routine INR monitoring.",
+        "guideline": "CPIC guideline for warfarin, CYP2C9, VKORC1, CYP4F2 (2017)",
+    },
+    "PHENYTOIN": {
+        "confidence": 0.87,
+        "clinical_action": "Standard dosing. Routine serum level monitoring.",
+        "guideline": "CPIC guideline for phenytoin and CYP2C9, HLA-B (2020)",
+    },
+    "CLOPIDOGREL": {
+        "confidence": 0.90,
+        "clinical_action": "Standard clopidogrel dosing recommended.",
+        "guideline": "CPIC guideline for clopidogrel and CYP2C19 (2013, updated 2022)",
+    },
+    "AZATHIOPRINE": {
+        "confidence": 0.88,
+        "clinical_action": "Standard dosing. Routine CBC monitoring per label.",
+        "guideline": "CPIC guideline for thiopurines and TPMT, NUDT15 (2018, updated 2021)",
+    },
+    "MERCAPTOPURINE": {
+        "confidence": 0.88,
+        "clinical_action": "Standard dosing.",
+        "guideline": "CPIC guideline for thiopurines and TPMT, NUDT15 (2018, updated 2021)",
+    },
+    "THIOGUANINE": {
+        "confidence": 0.88,
+        "clinical_action": "Standard dosing.",
+        "guideline": "CPIC guideline for thiopurines and TPMT, NUDT15 (2018, updated 2021)",
+    },
+    "FLUOROURACIL": {
+        "confidence": 0.88,
+        "clinical_action": "Standard dosing per oncology protocol.",
+        "guideline": "CPIC guideline for fluoropyrimidines and DPYD (2017, updated 2022)",
+    },
+    "CAPECITABINE": {
+        "confidence": 0.88,
+        "clinical_action": "Standard dosing.",
+        "guideline": "CPIC guideline for fluoropyrimidines and DPYD (2017, updated 2022)",
+    },
+    "AMITRIPTYLINE": {
+        "confidence": 0.87,
+        "clinical_action": "Standard dosing.",
+        "guideline": "CPIC guideline for tricyclic antidepressants and CYP2D6, CYP2C19 (2016)",
+    },
+    "CITALOPRAM": {
+        "confidence": 0.88,
+        "clinical_action": "Standard dosing.",
+        "guideline": "CPIC guideline for SSRIs and CYP2C19 (2015)",
+    },
+}
+
+VALID_SEVERITIES = {"none", "low", "moderate", "high", "critical"}
+
+# Rule match strings are constant, so lowercase them once here instead of on
+# every assessment. "phenotype_match" keeps the original text for display.
+# Phenotype labels are a small closed set; interning them lets dict lookups
+# and == comparisons succeed on identity. Severities are validated here too
+# ("_severity"), falling back to "low".
+for _rules in DRUG_RULES.values():
+    for _rule in _rules:
+        _severity = _rule.get("severity", "low")
+        _rule["_severity"] = _severity if _severity in VALID_SEVERITIES else "low"
+        if "alternatives" in _rule:
+            _rule["alternatives"] = tuple(_rule["alternatives"])
+        _rule["phenotype_match"] = [sys.intern(m) for m in _rule.get("phenotype_match", [])]
+        _rule["_pm_lower"] = tuple(sys.intern(m.lower()) for m in _rule["phenotype_match"])
+        _rule["_pm_set"] = frozenset(_rule["_pm_lower"])
+
+# Read-only from here on, so the tables can be shared freely (e.g. across
+# concurrent API requests) without defensive copies.
+DRUG_RULES = MappingProxyType({
+    drug: tuple(MappingProxyType(rule) for rule in rules)
+    for drug, rules in DRUG_RULES.items()
+})
+
+# drug → genes its rules reference, unique and in rule priority order
+DRUG_GENES = MappingProxyType({
+    drug: tuple(dict.fromkeys(rule["gene"] for rule in rules))
+    for drug, rules in DRUG_RULES.items()
+})
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # GENE PRIORITY ORDER
@@ -614,81 +607,162 @@ DRUG_PRIMARY_GENE: dict[str, str] = {
     "ABACAVIR":       "HLA-B",
     "CARBAMAZEPINE":  "HLA-B",
 }
-
-VALID_SEVERITIES = {"none", "low", "moderate", "high", "critical"}
-
-
-def _phenotype_matches(phenotype: str, match_list: list[str]) -> bool:
-    phenotype_lower = phenotype.lower()
-    for m in match_list:
-        if m.lower() in phenotype_lower or phenotype_lower in m.lower():
+DRUG_PRIMARY_GENE = MappingProxyType(DRUG_PRIMARY_GENE)
+
+# DRUG_DEFAULT_SAFE entries expanded into full rules on the primary gene, so
+# they go through the same matcher and result builder as DRUG_RULES.
+_DEFAULT_SAFE_PHENOTYPE = sys.intern("Normal Metabolizer")
+_DEFAULT_SAFE_RULES = MappingProxyType({
+    drug: MappingProxyType({
+        "gene":            DRUG_PRIMARY_GENE[drug],
+        "phenotype_match": [_DEFAULT_SAFE_PHENOTYPE],
+        "_pm_lower":       (sys.intern(_DEFAULT_SAFE_PHENOTYPE.lower()),),
+        "_pm_set":         frozenset((sys.intern(_DEFAULT_SAFE_PHENOTYPE.lower()),)),
+        "risk_label":      "Safe",
+        "severity":        "none",
+        "_severity":       "none",
+        **default,
+    })
+    for drug, default in DRUG_DEFAULT_SAFE.items()
+})
+DRUG_DEFAULT_SAFE = MappingProxyType({
+    drug: MappingProxyType(default) for drug, default in DRUG_DEFAULT_SAFE.items()
+})
+
+# Phenotype labels emitted by phenotype_mapper.py (see module docstring)
+KNOWN_PHENOTYPES = (
+    "Poor Metabolizer", "Intermediate Metabolizer", "Normal Metabolizer",
+    "Rapid Metabolizer", "Ultrarapid Metabolizer",
+    "Normal Function", "Decreased Function", "Poor Function",
+    "Positive", "Negative", "Indeterminate", "Unknown",
+)
+SLCO1B1_MYOPATHY_RISKS = (
+    "Normal myopathy risk", "Intermediate myopathy risk",
+    "High myopathy risk", "Unknown myopathy risk",
+)
+
+
+def _phenotype_matches(phenotype_lower: str, pm_set: frozenset, pm_lower: tuple[str, ...]) -> bool:
+    """
+    Match a lowercased patient phenotype against a rule's lowercased match
+    strings, either way round as a substring. Exact matches (the usual case)
+    are a set lookup; the substring scan is still needed because e.g. a
+    "Rapid Metabolizer" rule also matches "Ultrarapid Metabolizer" patients.
+    """
+    if phenotype_lower in pm_set:
+        return True
+    for m in pm_lower:
+        if m in phenotype_lower or phenotype_lower in m:
             return True
     return False
 
 
-def assess_drug_risk(
-    drug: str,
-    phenotype_profile: dict[str, dict]
-) -> RiskResult:
-    drug_upper = drug.upper().strip()
-    rules = DRUG_RULES.get(drug_upper)
-    primary_gene = DRUG_PRIMARY_GENE.get(drug_upper, "Unknown")
+def _first_match(rules: tuple[dict, ...], gene: str, phenotype_lower: str) -> Optional[int]:
+    """Position of the first rule for `gene` matching `phenotype_lower`, or None."""
+    for position, rule in enumerate(rules):
+        if rule["gene"] == gene and _phenotype_matches(phenotype_lower, rule["_pm_set"], rule["_pm_lower"]):
+            return position
+    return None
 
-    if not rules:
-        gene_data = phenotype_profile.get(primary_gene, {})
-        return RiskResult(
-            drug=drug_upper,
-            risk_label="Unknown",
-            severity="low",
-            confidence_score=0.0,
-            primary_gene=primary_gene,
-            phenotype=gene_data.get("phenotype", "Unknown"),
-            diplotype=gene_data.get("diplotype", "Unknown"),
-            detected_variants=gene_data.get("detected_variants", []),
-            clinical_action=f"No pharmacogenomic guideline available for {drug}. Use standard prescribing information.",
-            guideline="No CPIC/DPWG guideline available",
-        )
 
-    for rule in rules:
-        gene = rule["gene"]
-        gene_data = phenotype_profile.get(gene, {})
-        patient_phenotype = gene_data.get("phenotype", "")
+# ─────────────────────────────────────────────────────────────────────────────
+# COMPILED RULES
+# drug → {(gene, lowercased patient phenotype) → position in DRUG_RULES[drug]
+# of the first rule for that gene that matches, or None}. Built with the same
+# substring matcher over every phenotype the mapper can emit, so a lookup
+# gives exactly the result of the rule scan. Positions (not rules) are stored
+# so drugs with rules on several genes (AMITRIPTYLINE) keep their priority
+# order: the earliest position across genes wins. Phenotypes outside this
+# vocabulary fall back to the scan.
+# ─────────────────────────────────────────────────────────────────────────────
+_UNINDEXED = object()
+
+COMPILED_RULES: dict[str, dict[tuple[str, str], Optional[int]]] = {}
+for _drug, _rules in DRUG_RULES.items():
+    _compiled = COMPILED_RULES[_drug] = {}
+    _vocab = set(KNOWN_PHENOTYPES)
+    for _rule in _rules:
+        _vocab.update(_rule.get("phenotype_match", []))
+    for _gene in DRUG_GENES[_drug]:
+        if _gene == "SLCO1B1":
+            _phenotypes = {f"{p} {m}" for p in _vocab for m in SLCO1B1_MYOPATHY_RISKS}
+        else:
+            _phenotypes = _vocab
+        for _phenotype_lower in {sys.intern(p.lower()) for p in _phenotypes}:
+            _compiled[(_gene, _phenotype_lower)] = _first_match(_rules, _gene, _phenotype_lower)
+
+
+def _patient_phenotype(gene: str, gene_data: dict) -> str:
+    if gene == "SLCO1B1":
+        return (
+            gene_data.get("phenotype", "") + " " +
+            gene_data.get("myopathy_risk", "")
+        ).strip()
+    return gene_data.get("phenotype", "")
+
+
+_NO_GENE_DATA = ({}, "", "")
+
+
+def _prepare_profile(phenotype_profile: dict[str, dict]) -> dict[str, tuple[dict, str, str]]:
+    """
+    gene → (gene_data, patient phenotype, lowercased patient phenotype).
+    Built once per patient so multi-drug assessments do not rebuild the
+    SLCO1B1 combined phenotype or re-lowercase phenotypes for every drug.
+    """
+    prepared = {}
+    for gene, gene_data in phenotype_profile.items():
+        patient_phenotype = _patient_phenotype(gene, gene_data)
+        prepared[gene] = (
+            gene_data,
+            patient_phenotype,
+            sys.intern(patient_phenotype.lower()) if patient_phenotype else "",
+        )
+    return prepared
 
-        if gene == "SLCO1B1":
-            patient_phenotype = (
-                gene_data.get("phenotype", "") + " " +
-                gene_data.get("myopathy_risk", "")
-            ).strip()
 
+def _scan_rules(rules: tuple[dict, ...], prepared: dict[str, tuple]) -> Optional[int]:
+    """Linear first-match scan in priority order (fallback for unindexed phenotypes)."""
+    for position, rule in enumerate(rules):
+        _, patient_phenotype, phenotype_lower = prepared.get(rule["gene"], _NO_GENE_DATA)
         if not patient_phenotype:
             continue
 
-        if _phenotype_matches(patient_phenotype, rule.get("phenotype_match", [])):
-            severity = rule.get("severity", "low")
-            if severity not in VALID_SEVERITIES:
-                severity = "low"
-            logger.info(
-                "Drug %s matched: gene=%s phenotype=%s → %s (severity=%s)",
-                drug_upper, gene, patient_phenotype, rule["risk_label"], severity
-            )
-            return RiskResult(
-                drug=drug_upper,
-                risk_label=rule["risk_label"],
-                severity=severity,
-                confidence_score=rule["confidence"],
-                primary_gene=gene,
-                phenotype=patient_phenotype.strip(),
-                diplotype=gene_data.get("diplotype", "Unknown"),
-                detected_variants=gene_data.get("detected_variants", []),
-                clinical_action=rule.get("clinical_action", ""),
-                alternative_drugs=rule.get("alternatives", []),
-                dose_adjustment=rule.get("dose_adjustment"),
-                monitoring=rule.get("monitoring"),
-                guideline=rule.get("guideline", ""),
-            )
+        if _phenotype_matches(phenotype_lower, rule["_pm_set"], rule["_pm_lower"]):
+            return position
+    return None
+
 
+def _result_from_rule(drug_upper: str, rule: dict, prepared: dict[str, tuple]) -> RiskResult:
+    """RiskResult for a matched DRUG_RULES or default Safe rule."""
+    gene = rule["gene"]
+    gene_data, patient_phenotype, _ = prepared[gene]
+    severity = rule["_severity"]
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Drug %s matched: gene=%s phenotype=%s → %s (severity=%s)",
+            drug_upper, gene, patient_phenotype, rule["risk_label"], severity
+        )
+    return RiskResult(
+        drug=drug_upper,
+        risk_label=rule["risk_label"],
+        severity=severity,
+        confidence_score=rule["confidence"],
+        primary_gene=gene,
+        phenotype=patient_phenotype.strip(),
+        diplotype=gene_data.get("diplotype", "Unknown"),
+        detected_variants=tuple(gene_data.get("detected_variants", ())),
+        clinical_action=rule.get("clinical_action", ""),
+        alternative_drugs=rule.get("alternatives", ()),
+        dose_adjustment=rule.get("dose_adjustment"),
+        monitoring=rule.get("monitoring"),
+        guideline=rule.get("guideline", ""),
+    )
+
+
+def _no_match_result(drug_upper: str, primary_gene: str, prepared: dict[str, tuple]) -> RiskResult:
     # No rule matched → Safe fallback
-    gene_data = phenotype_profile.get(primary_gene, {})
+    gene_data = prepared.get(primary_gene, _NO_GENE_DATA)[0]
     return RiskResult(
         drug=drug_upper,
         risk_label="Safe",
@@ -697,14 +771,116 @@ def assess_drug_risk(
         primary_gene=primary_gene,
         phenotype=gene_data.get("phenotype", "Normal Metabolizer"),
         diplotype=gene_data.get("diplotype", "*1/*1"),
-        detected_variants=gene_data.get("detected_variants", []),
+        detected_variants=tuple(gene_data.get("detected_variants", ())),
         clinical_action="No pharmacogenomic risk factors identified. Use standard prescribing information.",
         guideline="CPIC / DPWG guidelines consulted",
     )
 
 
+def _unknown_drug_result(drug: str, drug_upper: str, prepared: dict[str, tuple]) -> RiskResult:
+    primary_gene = DRUG_PRIMARY_GENE.get(drug_upper, "Unknown")
+    gene_data = prepared.get(primary_gene, _NO_GENE_DATA)[0]
+    return RiskResult(
+        drug=drug_upper,
+        risk_label="Unknown",
+        severity="low",
+        confidence_score=0.0,
+        primary_gene=primary_gene,
+        phenotype=gene_data.get("phenotype", "Unknown"),
+        diplotype=gene_data.get("diplotype", "Unknown"),
+        detected_variants=tuple(gene_data.get("detected_variants", ())),
+        clinical_action=f"No pharmacogenomic guideline available for {drug}. Use standard prescribing information.",
+        guideline="No CPIC/DPWG guideline available",
+    )
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# PER-DRUG DISPATCH
+# Each drug's rule set is fixed at import, so its assessment is specialised
+# once: the closure binds the drug's genes (in priority order), its
+# COMPILED_RULES table, rules, primary gene and default Safe rule. A call is
+# then one dict lookup per gene with no generic rule iteration.
+# ─────────────────────────────────────────────────────────────────────────────
+def _compile_drug(drug_upper: str, rules: tuple[dict, ...]) -> Callable[[dict], RiskResult]:
+    primary_gene = DRUG_PRIMARY_GENE.get(drug_upper, "Unknown")
+    default_rule = _DEFAULT_SAFE_RULES.get(drug_upper)
+    genes = DRUG_GENES[drug_upper]
+    compiled = COMPILED_RULES[drug_upper]
+
+    def assess(prepared: dict[str, tuple]) -> RiskResult:
+        best = None
+        for gene in genes:
+            _, patient_phenotype, phenotype_lower = prepared.get(gene, _NO_GENE_DATA)
+            if not patient_phenotype:
+                continue
+            position = compiled.get((gene, phenotype_lower), _UNINDEXED)
+            if position is _UNINDEXED:
+                best = _scan_rules(rules, prepared)
+                break
+            if position is not None and (best is None or position < best):
+                best = position
+
+        if best is not None:
+            return _result_from_rule(drug_upper, rules[best], prepared)
+
+        if default_rule is not None:
+            _, patient_phenotype, phenotype_lower = prepared.get(primary_gene, _NO_GENE_DATA)
+            if patient_phenotype and _phenotype_matches(
+                phenotype_lower, default_rule["_pm_set"], default_rule["_pm_lower"]
+            ):
+                return _result_from_rule(drug_upper, default_rule, prepared)
+
+        return _no_match_result(drug_upper, primary_gene, prepared)
+
+    assess.__name__ = assess.__qualname__ = f"_assess_{drug_upper}"
+    return assess
+
+
+DRUG_DISPATCH = MappingProxyType({
+    drug: _compile_drug(drug, rules) for drug, rules in DRUG_RULES.items()
+})
+
+
+@functools.lru_cache(maxsize=256)
+def _norm_drug(drug: str) -> str:
+    """Canonical DRUG_RULES key for a user-supplied drug name."""
+    return drug.upper().strip()
+
+
+def assess_drug_risk(
+    drug: str,
+    phenotype_profile: dict[str, dict]
+) -> RiskResult:
+    return _assess_with_prepared(drug, _prepare_profile(phenotype_profile))
+
+
+def _assess_with_prepared(drug: str, prepared: dict[str, tuple]) -> RiskResult:
+    """assess_drug_risk body, against a profile from _prepare_profile."""
+    drug_upper = _norm_drug(drug)
+    assess = DRUG_DISPATCH.get(drug_upper)
+    if assess is None:
+        return _unknown_drug_result(drug, drug_upper, prepared)
+    return assess(prepared)
+
+
 def assess_multiple_drugs(
     drugs: list[str],
     phenotype_profile: dict[str, dict]
 ) -> list[RiskResult]:
-    return [assess_drug_risk(drug, phenotype_profile) for drug in drugs]
+    prepared = _prepare_profile(phenotype_profile)
+    return [_assess_with_prepared(drug, prepared) for drug in drugs]
+
+
+def assess_batch(
+    phenotype_profiles: list[dict[str, dict]],
+    drugs: list[str]
+) -> list[list[RiskResult]]:
+    """
+    Cohort screening: assess every drug for every patient.
+    Returns one list of results per profile, in `drugs` order.
+    """
+    prepared_profiles = [_prepare_profile(profile) for profile in phenotype_profiles]
+    return [
+        [_assess_with_prepared(drug, prepared) for drug in drugs]
+        for prepared in prepared_profiles
+    ]
@@ -8,7 +8,12 @@ Supports: CYP2D6, CYP2C19, CYP2C9, SLCO1B1, TPMT, DPYD, HLA-B, HLA-A
 
 # rift26-hackathon\ML\phenotype_mapper.py
 
+import sys
+import math
 import logging
+import functools
+from bisect import bisect_right
+from types import MappingProxyType
 from typing import Optional
 
 logger = logging.getLogger(__name__)
@@ -29,6 +34,20 @@ ACTIVITY_SCORES = {
     },
 }
 
+# Activity-score bands for a non-zero total (zero is always Poor): the label
+# is labels[bisect_right(cutoffs, total)]. CYP2D6 Normal includes 2.25, so its
+# Ultrarapid cut sits on the next float above.
+ACTIVITY_SCORE_BANDS = {
+    "CYP2D6": (
+        (1.0, math.nextafter(2.25, math.inf)),
+        ("Intermediate Metabolizer", "Normal Metabolizer", "Ultrarapid Metabolizer"),
+    ),
+    "CYP2C9": (
+        (1.5,),
+        ("Intermediate Metabolizer", "Normal Metabolizer"),
+    ),
+}
+
 # ─────────────────────────────────────────────────────────────────────────────
 # DIPLOTYPE → PHENOTYPE LOOKUP TABLES
 # ─────────────────────────────────────────────────────────────────────────────
@@ -116,13 +135,50 @@ DPYD_DIPLOTYPE_PHENOTYPE = {
     "HapB3/HapB3": "Intermediate Metabolizer",
 }
 
-GENE_PHENOTYPE_TABLES = {
-    "CYP2D6":  CYP2D6_DIPLOTYPE_PHENOTYPE,
-    "CYP2C19": CYP2C19_DIPLOTYPE_PHENOTYPE,
-    "CYP2C9":  CYP2C9_DIPLOTYPE_PHENOTYPE,
-    "TPMT":    TPMT_DIPLOTYPE_PHENOTYPE,
-    "DPYD":    DPYD_DIPLOTYPE_PHENOTYPE,
-}
+
+def _freeze_table(table: dict) -> MappingProxyType:
+    """Read-only copy of a lookup table with its key and value strings interned."""
+    return MappingProxyType({
+        sys.intern(key): sys.intern(value) if isinstance(value, str) else tuple(map(sys.intern, value))
+        for key, value in table.items()
+    })
+
+
+# The tables are never written after import, so freeze them
+CYP2D6_DIPLOTYPE_PHENOTYPE  = _freeze_table(CYP2D6_DIPLOTYPE_PHENOTYPE)
+CYP2C19_DIPLOTYPE_PHENOTYPE = _freeze_table(CYP2C19_DIPLOTYPE_PHENOTYPE)
+CYP2C9_DIPLOTYPE_PHENOTYPE  = _freeze_table(CYP2C9_DIPLOTYPE_PHENOTYPE)
+SLCO1B1_DIPLOTYPE_PHENOTYPE = _freeze_table(SLCO1B1_DIPLOTYPE_PHENOTYPE)
+TPMT_DIPLOTYPE_PHENOTYPE    = _freeze_table(TPMT_DIPLOTYPE_PHENOTYPE)
+DPYD_DIPLOTYPE_PHENOTYPE    = _freeze_table(DPYD_DIPLOTYPE_PHENOTYPE)
+ACTIVITY_SCORES = MappingProxyType({
+    sys.intern(gene): MappingProxyType(scores) for gene, scores in ACTIVITY_SCORES.items()
+})
+ACTIVITY_SCORE_BANDS = MappingProxyType(ACTIVITY_SCORE_BANDS)
+
+GENE_PHENOTYPE_TABLES = MappingProxyType({
+    sys.intern("CYP2D6"):  CYP2D6_DIPLOTYPE_PHENOTYPE,
+    sys.intern("CYP2C19"): CYP2C19_DIPLOTYPE_PHENOTYPE,
+    sys.intern("CYP2C9"):  CYP2C9_DIPLOTYPE_PHENOTYPE,
+    sys.intern("TPMT"):    TPMT_DIPLOTYPE_PHENOTYPE,
+    sys.intern("DPYD"):    DPYD_DIPLOTYPE_PHENOTYPE,
+})
+
+# "gene|diplotype" → phenotype for every table above, SLCO1B1 included, with
+# each diplotype also stored in reversed allele order ("*4/*1" → "*1/*4") so a
+# lookup is one probe on one flat string key whichever order the alleles come
+# in. Table entries win over reversed ones if both orders are listed.
+_FLAT_PHENOTYPE: dict[str, str] = {}
+for _gene, _table in {
+    **GENE_PHENOTYPE_TABLES,
+    "SLCO1B1": {d: phenotype for d, (phenotype, _) in SLCO1B1_DIPLOTYPE_PHENOTYPE.items()},
+}.items():
+    for _diplotype, _phenotype in _table.items():
+        _FLAT_PHENOTYPE[sys.intern(f"{_gene}|{_diplotype}")] = _phenotype
+    for _diplotype, _phenotype in _table.items():
+        _a, _b = _diplotype.split("/")
+        _FLAT_PHENOTYPE.setdefault(sys.intern(f"{_gene}|{_b}/{_a}"), _phenotype)
+_FLAT_PHENOTYPE = MappingProxyType(_FLAT_PHENOTYPE)
 
 SLCO1B1_RS4149056_PHENOTYPE = {
     "TT": ("Normal Function",    "Normal myopathy risk",       "*1a/*1a"),
@@ -130,18 +186,30 @@ SLCO1B1_RS4149056_PHENOTYPE = {
     "CT": ("Decreased Function", "Intermediate myopathy risk", "*1a/*5"),
     "CC": ("Poor Function",      "High myopathy risk",         "*5/*5"),
 }
+SLCO1B1_RS4149056_PHENOTYPE = _freeze_table(SLCO1B1_RS4149056_PHENOTYPE)
 
 # ─────────────────────────────────────────────────────────────────────────────
 # HLA-B tag SNPs
 # rs2395029 / rs9264942  → HLA-B*57:01  (abacavir hypersensitivity)
 # rs3909184 / rs2844682  → HLA-B*15:02  (carbamazepine SJS/TEN)
 # ─────────────────────────────────────────────────────────────────────────────
-HLA_B_5701_RSIDS = {"rs2395029", "rs9264942"}
-HLA_B_1502_RSIDS = {"rs3909184", "rs2844682"}
+HLA_B_5701_RSIDS = frozenset({"rs2395029", "rs9264942"})
+HLA_B_1502_RSIDS = frozenset({"rs3909184", "rs2844682"})
 
 # HLA-A tag SNPs
 # rs1061235 → HLA-A*31:01 (carbamazepine DRESS)
-HLA_A_3101_RSIDS = {"rs1061235"}
+HLA_A_3101_RSIDS = frozenset({"rs1061235"})
+
+# Profile entry injected for an HLA gene with no variants in the VCF
+_HLA_GENES = ("HLA-B", "HLA-A")
+_HLA_NEGATIVE = MappingProxyType({
+    "diplotype":     "Wildtype",
+    "phenotype":     "Negative",
+    "myopathy_risk": None,
+})
+
+# Zygosities that count as carrying the alt allele
+_HET_OR_HOM = frozenset({"heterozygous", "homozygous_alt"})
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -153,124 +221,202 @@ def _star_allele_from_variant(variant: dict) -> str:
     return sa if sa and sa != "unknown" else "*?"
 
 
-def _infer_diplotype_from_variants(gene: str, variants: list[dict]) -> tuple[str, str]:
+def _infer_diplotype_from_variants(gene: str, variants: list[dict]) -> tuple[str, str, list[str]]:
+    """Returns (diplotype, phenotype, detected rsIDs) from one pass over the variants."""
     if not variants:
-        return "*1/*1", _phenotype_lookup(gene, "*1/*1")
+        return "*1/*1", _phenotype_lookup(gene, "*1/*1"), []
 
     alleles = []
+    detected = []
+    append = alleles.append
     for v in variants:
+        vget = v.get
         sa = _star_allele_from_variant(v)
-        zyg = v.get("zygosity", "heterozygous")
-        if zyg == "homozygous_alt":
-            alleles.extend([sa, sa])
-        else:
-            alleles.append(sa)
+        append(sa)
+        if vget("zygosity", "heterozygous") == "homozygous_alt":
+            append(sa)
+        rsid = vget("rsid")
+        if rsid:
+            detected.append(rsid)
 
     if len(alleles) == 0:
         diplotype = "*1/*1"
     elif len(alleles) == 1:
         diplotype = f"*1/{alleles[0]}"
     else:
-        sorted_alleles = sorted(alleles[:2])
-        diplotype = f"{sorted_alleles[0]}/{sorted_alleles[1]}"
+        a, b = alleles[0], alleles[1]
+        diplotype = f"{a}/{b}" if a <= b else f"{b}/{a}"
 
     phenotype = _phenotype_lookup(gene, diplotype)
-    return diplotype, phenotype
+    return diplotype, phenotype, detected
 
 
-def _phenotype_lookup(gene: str, diplotype: str) -> str:
-    parts = diplotype.split("/")
-    if len(parts) == 2:
-        canonical   = f"{parts[0]}/{parts[1]}"
-        alternative = f"{parts[1]}/{parts[0]}"
-    else:
-        canonical = alternative = diplotype
+def _activity_score_phenotype(gene: str, total: float) -> str:
+    """Phenotype label for a diplotype's summed activity score (CYP2D6 / CYP2C9)."""
+    if total == 0:
+        return "Poor Metabolizer"
+    cutoffs, labels = ACTIVITY_SCORE_BANDS[gene]
+    return labels[bisect_right(cutoffs, total)]
 
-    if gene == "SLCO1B1":
-        val = (SLCO1B1_DIPLOTYPE_PHENOTYPE.get(canonical) or
-               SLCO1B1_DIPLOTYPE_PHENOTYPE.get(alternative))
-        return val[0] if val else "Indeterminate"
 
-    table = GENE_PHENOTYPE_TABLES.get(gene, {})
-    phenotype = table.get(canonical) or table.get(alternative)
+@functools.lru_cache(maxsize=1024)
+def _phenotype_lookup(gene: str, diplotype: str) -> str:
+    """Pure in (gene, diplotype), whose domain is small, so results are memoised."""
+    phenotype = _FLAT_PHENOTYPE.get(f"{gene}|{diplotype}")
     if phenotype:
         return phenotype
 
     # Activity-score fallback for CYP2D6 / CYP2C9
-    if gene in ACTIVITY_SCORES and len(parts) == 2:
+    parts = diplotype.split("/") if gene in ACTIVITY_SCORES else ()
+    if len(parts) == 2:
         scores = ACTIVITY_SCORES[gene]
-        total = scores.get(parts[0], 1.0) + scores.get(parts[1], 1.0)
-        if gene == "CYP2D6":
-            if total == 0:      return "Poor Metabolizer"
-            elif total < 1.0:   return "Intermediate Metabolizer"
-            elif total <= 2.25: return "Normal Metabolizer"
-            else:               return "Ultrarapid Metabolizer"
-        elif gene == "CYP2C9":
-            if total == 0:      return "Poor Metabolizer"
-            elif total < 1.5:   return "Intermediate Metabolizer"
-            else:               return "Normal Metabolizer"
+        return _activity_score_phenotype(gene, scores.get(parts[0], 1.0) + scores.get(parts[1], 1.0))
 
     return "Indeterminate"
 
 
-def _handle_slco1b1(variants: list[dict]) -> tuple[str, str, str]:
+# Warm the cache with every tabulated diplotype
+for _key in _FLAT_PHENOTYPE:
+    _phenotype_lookup(*_key.split("|", 1))
+
+
+def _handle_slco1b1(variants: list[dict]) -> tuple[str, str, str, list[str]]:
+    """
+    Returns (diplotype, phenotype, myopathy_risk, detected rsIDs).
+    The first rs4149056 record decides the phenotype; the scan continues
+    only to collect the remaining rsIDs.
+    """
+    result = None
+    detected = []
     for v in variants:
-        if v.get("rsid") == "rs4149056":
-            ref = v.get("ref", "T")
-            alt = v.get("alt", "C")
-            zyg = v.get("zygosity", "heterozygous")
+        vget = v.get
+        rsid = vget("rsid")
+        if not rsid:
+            continue
+        detected.append(rsid)
+        if result is None and rsid == "rs4149056":
+            ref = vget("ref", "T")
+            alt = vget("alt", "C")
+            zyg = vget("zygosity", "heterozygous")
             if zyg == "homozygous_alt":
                 geno_key = alt + alt
             elif zyg == "heterozygous":
                 geno_key = ref + alt
             else:
                 geno_key = ref + ref
+            # vcf_parser upper-cases REF/ALT, so geno_key matches the table as-is
             result = SLCO1B1_RS4149056_PHENOTYPE.get(
-                geno_key.upper(),
+                geno_key,
                 ("Indeterminate", "Unknown myopathy risk", "*?/*?")
             )
-            return result[2], result[0], result[1]
-    return "*1a/*1a", "Normal Function", "Normal myopathy risk"
+
+    if result is None:
+        return "*1a/*1a", "Normal Function", "Normal myopathy risk", detected
+    return result[2], result[0], result[1], detected
 
 
-def _handle_hla_b(variants: list[dict]) -> tuple[str, str]:
+def _handle_hla_b(variants: list[dict]) -> tuple[str, str, list[str]]:
     """
     Determine HLA-B phenotype from detected variants.
-    Returns (diplotype, phenotype) where phenotype is "Positive" or "Negative".
+    Returns (diplotype, phenotype, detected rsIDs) where phenotype is "Positive" or "Negative".
 
     Checks for HLA-B*57:01 (abacavir) and HLA-B*15:02 (carbamazepine) tag SNPs.
     Only heterozygous or homozygous_alt variants count — 0/0 are skipped by parser.
+    *57:01 takes precedence over *15:02 wherever each appears in the list.
     """
-    rsids_present = {
-        v.get("rsid")
-        for v in variants
-        if v.get("zygosity") in ("heterozygous", "homozygous_alt") and v.get("rsid")
-    }
+    found_5701 = found_1502 = False
+    detected = []
+    for v in variants:
+        vget = v.get
+        rsid = vget("rsid")
+        if not rsid:
+            continue
+        detected.append(rsid)
+        if vget("zygosity") in _HET_OR_HOM:
+            if rsid in HLA_B_5701_RSIDS:
+                found_5701 = True
+            elif rsid in HLA_B_1502_RSIDS:
+                found_1502 = True
+
+    if found_5701:
+        return "*57:01 Positive", "Positive", detected
+    if found_1502:
+        return "*15:02 Positive", "Positive", detected
+
+    return "Wildtype", "Negative", detected
+
+
+def _handle_hla_a(variants: list[dict]) -> tuple[str, str, list[str]]:
+    """
+    Determine HLA-A phenotype from detected variants.
+    Returns (diplotype, phenotype, detected rsIDs) where phenotype is "Positive" or "Negative".
+    """
+    found_3101 = False
+    detected = []
+    for v in variants:
+        vget = v.get
+        rsid = vget("rsid")
+        if not rsid:
+            continue
+        detected.append(rsid)
+        if rsid in HLA_A_3101_RSIDS and vget("zygosity") in _HET_OR_HOM:
+            found_3101 = True
 
-    if rsids_present & HLA_B_5701_RSIDS:
-        return "*57:01 Positive", "Positive"
+    if found_3101:
+        return "*31:01 Positive", "Positive", detected
 
-    if rsids_present & HLA_B_1502_RSIDS:
-        return "*15:02 Positive", "Positive"
+    return "Wildtype", "Negative", detected
 
-    return "Wildtype", "Negative"
 
+# ─────────────────────────────────────────────────────────────────────────────
+# Per-gene profile entries
+# ─────────────────────────────────────────────────────────────────────────────
 
-def _handle_hla_a(variants: list[dict]) -> tuple[str, str]:
-    """
-    Determine HLA-A phenotype from detected variants.
-    Returns (diplotype, phenotype) where phenotype is "Positive" or "Negative".
-    """
-    rsids_present = {
-        v.get("rsid")
-        for v in variants
-        if v.get("zygosity") in ("heterozygous", "homozygous_alt") and v.get("rsid")
+def _profile_entry(
+    diplotype: str,
+    phenotype: str,
+    myopathy_risk: Optional[str],
+    detected: list[str],
+    variants: list[dict],
+) -> dict:
+    return {
+        "diplotype":         diplotype,
+        "phenotype":         phenotype,
+        "myopathy_risk":     myopathy_risk,
+        "detected_variants": detected,
+        "raw_variants":      variants,
     }
 
-    if rsids_present & HLA_A_3101_RSIDS:
-        return "*31:01 Positive", "Positive"
 
-    return "Wildtype", "Negative"
+def _slco1b1_entry(gene: str, variants: list[dict]) -> dict:
+    """SLCO1B1 — transport function model."""
+    return _profile_entry(*_handle_slco1b1(variants), variants)
+
+
+def _hla_b_entry(gene: str, variants: list[dict]) -> dict:
+    """HLA-B — presence/absence model."""
+    diplotype, phenotype, detected = _handle_hla_b(variants)
+    return _profile_entry(diplotype, phenotype, None, detected, variants)
+
+
+def _hla_a_entry(gene: str, variants: list[dict]) -> dict:
+    """HLA-A — presence/absence model."""
+    diplotype, phenotype, detected = _handle_hla_a(variants)
+    return _profile_entry(diplotype, phenotype, None, detected, variants)
+
+
+def _star_allele_entry(gene: str, variants: list[dict]) -> dict:
+    """All other genes — star-allele / activity-score model."""
+    diplotype, phenotype, detected = _infer_diplotype_from_variants(gene, variants)
+    return _profile_entry(diplotype, phenotype, None, detected, variants)
+
+
+# gene → entry builder; genes not listed use _star_allele_entry
+_GENE_HANDLERS = MappingProxyType({
+    "SLCO1B1": _slco1b1_entry,
+    "HLA-B":   _hla_b_entry,
+    "HLA-A":   _hla_a_entry,
+})
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -290,79 +436,28 @@ def map_phenotypes(grouped_variants: dict[str, list[dict]]) -> dict[str, dict]:
     dict  gene → {diplotype, phenotype, myopathy_risk, detected_variants, raw_variants}
     """
     results = {}
+    handler_for = _GENE_HANDLERS.get
+    # Checked per call, not at import: main.py configures logging after importing us
+    debug = logger.isEnabledFor(logging.DEBUG)
 
     for gene, variants in grouped_variants.items():
+        entry = results[gene] = handler_for(gene, _star_allele_entry)(gene, variants)
 
-        # ── SLCO1B1 — transport function model ───────────────────────────────
-        if gene == "SLCO1B1":
-            diplotype, phenotype, myopathy_risk = _handle_slco1b1(variants)
-            results[gene] = {
-                "diplotype":         diplotype,
-                "phenotype":         phenotype,
-                "myopathy_risk":     myopathy_risk,
-                "detected_variants": [v.get("rsid") for v in variants if v.get("rsid")],
-                "raw_variants":      variants,
-            }
-
-        # ── HLA-B — presence/absence model ───────────────────────────────────
-        elif gene == "HLA-B":
-            diplotype, phenotype = _handle_hla_b(variants)
-            results[gene] = {
-                "diplotype":         diplotype,
-                "phenotype":         phenotype,
-                "myopathy_risk":     None,
-                "detected_variants": [v.get("rsid") for v in variants if v.get("rsid")],
-                "raw_variants":      variants,
-            }
-
-        # ── HLA-A — presence/absence model ───────────────────────────────────
-        elif gene == "HLA-A":
-            diplotype, phenotype = _handle_hla_a(variants)
-            results[gene] = {
-                "diplotype":         diplotype,
-                "phenotype":         phenotype,
-                "myopathy_risk":     None,
-                "detected_variants": [v.get("rsid") for v in variants if v.get("rsid")],
-                "raw_variants":      variants,
-            }
-
-        # ── All other genes — star-allele / activity-score model ──────────────
-        else:
-            diplotype, phenotype = _infer_diplotype_from_variants(gene, variants)
-            results[gene] = {
-                "diplotype":         diplotype,
-                "phenotype":         phenotype,
-                "myopathy_risk":     None,
-                "detected_variants": [v.get("rsid") for v in variants if v.get("rsid")],
-                "raw_variants":      variants,
-            }
-
-        logger.debug(
-            "Gene %s → diplotype=%s phenotype=%s",
-            gene, results[gene]["diplotype"], results[gene]["phenotype"]
-        )
+        if debug:
+            logger.debug(
+                "Gene %s → diplotype=%s phenotype=%s",
+                gene, entry["diplotype"], entry["phenotype"]
+            )
 
     # ── CRITICAL: Always inject HLA-B and HLA-A defaults ─────────────────────
     # If no HLA variants detected in VCF, mapper never creates these entries.
     # Without defaults, pgx_rules.py gets empty gene_data → no rule matches →
     # ABACAVIR and CARBAMAZEPINE return "Unknown".
     # Default "Negative" → rules match → returns "Safe" correctly.
-    if "HLA-B" not in results:
-        results["HLA-B"] = {
-            "diplotype":         "Wildtype",
-            "phenotype":         "Negative",
-            "myopathy_risk":     None,
-            "detected_variants": [],
-            "raw_variants":      [],
-        }
-
-    if "HLA-A" not in results:
-        results["HLA-A"] = {
-            "diplotype":         "Wildtype",
-            "phenotype":         "Negative",
-            "myopathy_risk":     None,
-            "detected_variants": [],
-            "raw_variants":      [],
-        }
+    # Each default is a fresh dict: profiles are handed to callers and stored
+    # in sessions, so a shared instance could be mutated across requests.
+    for gene in _HLA_GENES:
+        if gene not in results:
+            results[gene] = {**_HLA_NEGATIVE, "detected_variants": [], "raw_variants": []}
 
     return results
@@ -1,72 +1,197 @@
 """
 run.py — PharmaGuard Interactive Terminal
 Just run: python run.py
+
+Batch mode for cohorts, one VCF path per line in the list file:
+    python run.py --batch samples.txt --drug WARFARIN[,CODEINE,...] [--workers N]
 """
 
 # rift26-hackathon\ML\run.py
 
+import os
+import argparse
+from itertools import repeat
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+
 from vcf_parser import parse_vcf, group_variants_by_gene
 from phenotype_mapper import map_phenotypes
-from pgx_rules import assess_drug_risk
+from pgx_rules import DRUG_RULES, assess_drug_risk, assess_multiple_drugs
+
+BATCH_COLUMNS = ("vcf", "sample_id", "drug", "risk_label", "severity", "gene", "diplotype", "phenotype")
+
+
+def _build_drug_trie(names) -> dict:
+    """Nested {char: subtrie} dict; the None key on a node holds the full name ending there."""
+    root: dict = {}
+    for name in names:
+        node = root
+        for ch in name:
+            node = node.setdefault(ch, {})
+        node[None] = name
+    return root
+
+
+_DRUG_TRIE = _build_drug_trie(DRUG_RULES)
 
-# ── Step 1: Load and parse VCF ─────────────────────────────────────────────
-print("\n" + "="*55)
-print("   PHARMAGUARD — Pharmacogenomic Risk Prediction")
-print("="*55)
 
-vcf_file = input("\nEnter VCF filename (press Enter for 'test_patient.vcf'): ").strip()
-if not vcf_file:
-    vcf_file = "test_patient.vcf"
+def drug_completions(prefix: str) -> list[str]:
+    """Supported drug names starting with `prefix`, alphabetically."""
+    node = _DRUG_TRIE
+    for ch in prefix:
+        node = node.get(ch)
+        if node is None:
+            return []
 
-print(f"\n Parsing {vcf_file}...")
-parsed  = parse_vcf(vcf_file)
-grouped = group_variants_by_gene(parsed["variants"])
-profile = map_phenotypes(grouped)
+    names, stack = [], [node]
+    while stack:
+        for key, child in stack.pop().items():
+            if key is None:
+                names.append(child)
+            else:
+                stack.append(child)
+    return sorted(names)
 
-print(f" Sample ID      : {parsed['sample_id']}")
-print(f" Variants found : {parsed['pgx_variants_found']}")
 
-# ── Step 2: Show gene phenotype summary ────────────────────────────────────
-print("\n--- Gene Profile ---")
-for gene, data in profile.items():
-    if data["raw_variants"]:
-        print(f"  {gene:<12} {data['diplotype']:<15} → {data['phenotype']}")
+def resolve_drug(prefix: str) -> Optional[str]:
+    """Full drug name for an exact name or a unique prefix ('WARF' → 'WARFARIN'), else None."""
+    matches = drug_completions(prefix)
+    if prefix in matches:
+        return prefix
+    return matches[0] if len(matches) == 1 else None
 
-# ── Step 3: Ask for drug ───────────────────────────────────────────────────
-print("\n--- Supported Drugs ---")
-print("  CODEINE, TRAMADOL, WARFARIN, PHENYTOIN, CLOPIDOGREL,")
-print("  SIMVASTATIN, ATORVASTATIN, AZATHIOPRINE, MERCAPTOPURINE,")
-print("  FLUOROURACIL, CAPECITABINE, AMITRIPTYLINE, CITALOPRAM")
 
-while True:
-    print()
-    drug = input("Enter drug name (or 'quit' to exit): ").strip().upper()
+def _error_rows(drugs: list[str], message: str) -> list[tuple]:
+    """One ERROR row per drug, padded to the BATCH_COLUMNS layout (message last)."""
+    message = " ".join(message.split())  # keep the TSV on one line per row
+    return [(drug, "ERROR", "", "", "", message) for drug in drugs]
 
-    if drug in ("QUIT", "EXIT", "Q"):
-        print("\n Goodbye!\n")
-        break
 
-    if not drug:
-        continue
+def _assess_sample(vcf_path: str, drugs: list[str]) -> tuple[str, str, list[tuple]]:
+    """
+    Batch worker: parse one VCF and assess every drug against it.
+    Returns plain tuples so results pickle cheaply back to the parent.
+    A file that cannot be read through yields ERROR rows rather than a risk
+    call; per-line parse_errors do not change the outcome.
+    """
+    try:
+        parsed = parse_vcf(vcf_path)
+    except OSError as exc:
+        return vcf_path, "", _error_rows(drugs, str(exc))
+    if parsed["read_error"]:
+        return vcf_path, parsed["sample_id"], _error_rows(drugs, parsed["read_error"])
+    profile = map_phenotypes(group_variants_by_gene(parsed["variants"]))
+    rows = [
+        (r.drug, r.risk_label, r.severity, r.primary_gene, r.diplotype, r.phenotype)
+        for r in assess_multiple_drugs(drugs, profile)
+    ]
+    return vcf_path, parsed["sample_id"], rows
 
-    # ── Step 4: Risk assessment ────────────────────────────────────────────
-    risk = assess_drug_risk(drug, profile)
 
+def run_batch(list_path: str, drugs: list[str], workers: int) -> None:
+    """Fan VCF parsing out over worker processes; print one TSV row per sample × drug."""
+    with open(list_path, encoding="utf-8") as fh:
+        vcf_paths = [line.strip() for line in fh if line.strip() and not line.lstrip().startswith("#")]
+
+    print("\t".join(BATCH_COLUMNS))
+    # Each worker keeps its own warm lookup caches across the samples it is handed
+    chunksize = max(1, len(vcf_paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for vcf_path, sample_id, rows in pool.map(
+            _assess_sample, vcf_paths, repeat(drugs), chunksize=chunksize
+        ):
+            for row in rows:
+                print("\t".join((vcf_path, sample_id, *row)))
+
+
+def interactive() -> None:
+    # ── Step 1: Load and parse VCF ─────────────────────────────────────────────
     print("\n" + "="*55)
-    print(f"  RESULT FOR: {risk.drug}")
+    print("   PHARMAGUARD — Pharmacogenomic Risk Prediction")
     print("="*55)
-    print(f"  Risk Label   : {risk.risk_label}")
-    print(f"  Severity     : {risk.severity}")
-    print(f"  Confidence   : {risk.confidence_score:.0%}")
-    print(f"  Gene         : {risk.primary_gene}")
-    print(f"  Diplotype    : {risk.diplotype}")
-    print(f"  Phenotype    : {risk.phenotype}")
-    print(f"\n  Action       : {risk.clinical_action}")
-    if risk.alternative_drugs:
-        print(f"  Alternatives : {', '.join(risk.alternative_drugs)}")
-    if risk.dose_adjustment:
-        print(f"  Dose Adjust  : {risk.dose_adjustment}")
-    if risk.monitoring:
-        print(f"  Monitoring   : {risk.monitoring}")
-    print(f"\n  Guideline    : {risk.guideline}")
-    print("="*55)
\ No newline at end of file
+
+    vcf_file = input("\nEnter VCF filename (press Enter for 'test_patient.vcf'): ").strip()
+    if not vcf_file:
+        vcf_file = "test_patient.vcf"
+
+    print(f"\n Parsing {vcf_file}...")
+    parsed  = parse_vcf(vcf_file)
+    grouped = group_variants_by_gene(parsed["variants"])
+    profile = map_phenotypes(grouped)
+
+    print(f" Sample ID      : {parsed['sample_id']}")
+    print(f" Variants found : {parsed['pgx_variants_found']}")
+
+    # ── Step 2: Show gene phenotype summary ────────────────────────────────────
+    print("\n--- Gene Profile ---")
+    for gene, data in profile.items():
+        if data["raw_variants"]:
+            print(f"  {gene:<12} {data['diplotype']:<15} → {data['phenotype']}")
+
+    # ── Step 3: Ask for drug ───────────────────────────────────────────────────
+    print("\n--- Supported Drugs ---")
+    print("  CODEINE, TRAMADOL, WARFARIN, PHENYTOIN, CLOPIDOGREL,")
+    print("  SIMVASTATIN, ATORVASTATIN, AZATHIOPRINE, MERCAPTOPURINE,")
+    print("  FLUOROURACIL, CAPECITABINE, AMITRIPTYLINE, CITALOPRAM")
+
+    while True:
+        print()
+        drug = input("Enter drug name (or 'quit' to exit): ").strip().upper()
+
+        if drug in ("QUIT", "EXIT", "Q"):
+            print("\n Goodbye!\n")
+            break
+
+        if not drug:
+            continue
+
+        resolved = resolve_drug(drug)
+        if resolved:
+            drug = resolved
+        elif matches := drug_completions(drug):
+            print(f"  Ambiguous — did you mean: {', '.join(matches)}?")
+            continue
+
+        # ── Step 4: Risk assessment ────────────────────────────────────────────
+        risk = assess_drug_risk(drug, profile)
+
+        print("\n" + "="*55)
+        print(f"  RESULT FOR: {risk.drug}")
+        print("="*55)
+        print(f"  Risk Label   : {risk.risk_label}")
+        print(f"  Severity     : {risk.severity}")
+        print(f"  Confidence   : {risk.confidence_score:.0%}")
+        print(f"  Gene         : {risk.primary_gene}")
+        print(f"  Diplotype    : {risk.diplotype}")
+        print(f"  Phenotype    : {risk.phenotype}")
+        print(f"\n  Action       : {risk.clinical_action}")
+        if risk.alternative_drugs:
+            print(f"  Alternatives : {', '.join(risk.alternative_drugs)}")
+        if risk.dose_adjustment:
+            print(f"  Dose Adjust  : {risk.dose_adjustment}")
+        if risk.monitoring:
+            print(f"  Monitoring   : {risk.monitoring}")
+        print(f"\n  Guideline    : {risk.guideline}")
+        print("="*55)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="PharmaGuard pharmacogenomic risk prediction")
+    parser.add_argument("--batch", metavar="LIST", help="file listing one VCF path per line")
+    parser.add_argument("--drug", help="drug name, or comma-separated names, for --batch")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes for --batch (default: CPU count)")
+    args = parser.parse_args()
+
+    if not args.batch:
+        interactive()
+        return
+
+    drugs = [d.strip().upper() for d in (args.drug or "").split(",") if d.strip()]
+    if not drugs:
+        parser.error("--batch requires --drug")
+    run_batch(args.batch, drugs, max(1, args.workers))
+
+
+if __name__ == "__main__":
+    main()
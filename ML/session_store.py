@@ -0,0 +1,81 @@
+"""
+session_store.py — PharmaGuard VCF Session Storage
+Holds parsed VCF sessions between /upload-vcf and /analyze.
+
+Uses Redis when REDIS_URL is set, so sessions are shared across uvicorn
+workers and expire server-side. Otherwise falls back to an in-process
+store bounded by SESSION_MAX_ENTRIES with the same TTL.
+"""
+
+# rift26-hackathon\ML\session_store.py
+
+import json
+import time
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+SESSION_TTL_SECONDS = 3600
+SESSION_MAX_ENTRIES = 1000
+SESSION_KEY_PREFIX  = "pg:"
+
+
+class SessionStore:
+    """Expiring session_id → session dict store (Redis or in-process)."""
+
+    def __init__(
+        self,
+        redis_url: Optional[str] = None,
+        ttl: int = SESSION_TTL_SECONDS,
+        max_entries: int = SESSION_MAX_ENTRIES,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._redis = None
+        # session_id → (expires_at, session); insertion order == expiry order
+        self._local: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+        if redis_url and REDIS_AVAILABLE:
+            self._redis = aioredis.from_url(redis_url)
+            logger.info("Session store: Redis (ttl=%ds)", ttl)
+        else:
+            if redis_url:
+                logger.warning("REDIS_URL set but redis package not installed. Using in-process sessions.")
+            logger.info("Session store: in-process (ttl=%ds, max=%d)", ttl, max_entries)
+
+    async def get(self, session_id: str) -> Optional[dict]:
+        if self._redis is not None:
+            raw = await self._redis.get(SESSION_KEY_PREFIX + session_id)
+            return json.loads(raw) if raw is not None else None
+
+        entry = self._local.get(session_id)
+        if entry is None:
+            return None
+        expires_at, session = entry
+        if expires_at < time.monotonic():
+            del self._local[session_id]
+            return None
+        return session
+
+    async def set(self, session_id: str, session: dict) -> None:
+        if self._redis is not None:
+            await self._redis.setex(SESSION_KEY_PREFIX + session_id, self.ttl, json.dumps(session))
+            return
+
+        now = time.monotonic()
+        self._local[session_id] = (now + self.ttl, session)
+        # Oldest entries expire first, so evicting from the front handles
+        # both expiry and the size bound.
+        while self._local and (
+            len(self._local) > self.max_entries
+            or next(iter(self._local.values()))[0] < now
+        ):
+            self._local.popitem(last=False)
@@ -11,32 +11,33 @@ Usage:
 
 # rift26-hackathon\ML\test_pharmaguard.py
 
-import json
 import sys
 from pathlib import Path
+from typing import Optional
 from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
 
 # Add current directory to path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from vcf_parser       import parse_vcf, group_variants_by_gene
 from phenotype_mapper import map_phenotypes
-from pgx_rules        import assess_drug_risk
+from pgx_rules        import RiskResult, assess_drug_risk, assess_multiple_drugs
 from llm_explainer    import generate_explanation
 
 
-def build_full_report(patient_id: str, drug: str, parsed: dict, phenotype_profile: dict) -> dict:
-    """Build the complete PharmaGuard JSON report."""
-    risk      = assess_drug_risk(drug, phenotype_profile)
-    gene_data = phenotype_profile.get(risk.primary_gene, {})
-
-    detected_variants_rsids = [
-        v.get("rsid") for v in gene_data.get("raw_variants", [])
-        if v.get("rsid")
-    ]
-    detected_variants_full = [
-        {
-            "rsid":       v.get("rsid"),
+def _gene_variants(gene_data: dict) -> tuple[list, list[dict]]:
+    """(detected rsIDs, per-variant report dicts) for one gene's profile entry."""
+    detected_variants_rsids = []
+    detected_variants_full  = []
+    for v in gene_data.get("raw_variants", []):
+        rsid = v.get("rsid")
+        if rsid:
+            detected_variants_rsids.append(rsid)
+        detected_variants_full.append({
+            "rsid":       rsid,
             "gene":       v.get("gene"),
             "chromosome": v.get("chromosome"),
             "position":   v.get("position"),
@@ -45,23 +46,55 @@ def build_full_report(patient_id: str, drug: str, parsed: dict, phenotype_profil
             "genotype":   v.get("genotype"),
             "zygosity":   v.get("zygosity"),
             "star_allele": v.get("star_allele"),
-        }
-        for v in gene_data.get("raw_variants", [])
-    ]
+        })
+    return detected_variants_rsids, detected_variants_full
+
+
+def build_full_report(
+    patient_id: str,
+    drug: str,
+    parsed: dict,
+    phenotype_profile: dict,
+    timestamp: Optional[str] = None,
+    gene_variants_cache: Optional[dict] = None,
+    risk: Optional[RiskResult] = None,
+) -> dict:
+    """
+    Build the complete PharmaGuard JSON report.
+
+    `timestamp` lets every report of one run share a time stamp.
+    `gene_variants_cache` (gene → _gene_variants result) is filled and reused
+    across calls for the same profile, since several drugs share a gene.
+    `risk` may be precomputed by the caller; otherwise it is assessed here.
+    """
+    if risk is None:
+        risk = assess_drug_risk(drug, phenotype_profile)
+    primary_gene    = risk.primary_gene
+    phenotype       = risk.phenotype
+    diplotype       = risk.diplotype
+    risk_label      = risk.risk_label
+    clinical_action = risk.clinical_action
+    gene_data       = phenotype_profile.get(primary_gene, {})
+
+    if gene_variants_cache is None:
+        gene_variants_cache = {}
+    if primary_gene not in gene_variants_cache:
+        gene_variants_cache[primary_gene] = _gene_variants(gene_data)
+    detected_variants_rsids, detected_variants_full = gene_variants_cache[primary_gene]
 
     explanation = generate_explanation(
-        gene             = risk.primary_gene,
-        phenotype        = risk.phenotype,
+        gene             = primary_gene,
+        phenotype        = phenotype,
         drug             = drug,
         detected_variants= detected_variants_rsids,
-        diplotype        = risk.diplotype,
-        risk_label       = risk.risk_label,
-        clinical_action  = risk.clinical_action,
+        diplotype        = diplotype,
+        risk_label       = risk_label,
+        clinical_action  = clinical_action,
         guideline        = risk.guideline,
     )
 
     clinical_recommendation = {
-        "action":            risk.clinical_action,
+        "action":            clinical_action,
         "alternative_drugs": risk.alternative_drugs,
     }
     if risk.dose_adjustment:
@@ -72,18 +105,18 @@ def build_full_report(patient_id: str, drug: str, parsed: dict, phenotype_profil
     return {
         "patient_id": patient_id,
         "drug":       risk.drug,
-        "timestamp":  datetime.now(timezone.utc).isoformat(),
+        "timestamp":  timestamp or datetime.now(timezone.utc).isoformat(),
 
         "risk_assessment": {
-            "risk_label":       risk.risk_label,
+            "risk_label":       risk_label,
             "confidence_score": round(risk.confidence_score, 2),
             "severity":         risk.severity,
         },
 
         "pharmacogenomic_profile": {
-            "primary_gene":      risk.primary_gene,
-            "diplotype":         risk.diplotype,
-            "phenotype":         risk.phenotype,
+            "primary_gene":      primary_gene,
+            "diplotype":         diplotype,
+            "phenotype":         phenotype,
             "detected_variants": detected_variants_full,
         },
 
@@ -148,16 +181,28 @@ def run_tests():
     print("▶ Step 4: Drug risk assessments ...")
     print()
 
-    reports = []
-    for drug in test_drugs:
-        report = build_full_report(
+    timestamp = datetime.now(timezone.utc).isoformat()
+    gene_variants_cache: dict = {}
+    # One pass over the profile for every drug, instead of once per report
+    risks = assess_multiple_drugs(test_drugs, phenotype_profile)
+
+    def report_for(drug: str, risk: RiskResult) -> dict:
+        return build_full_report(
             patient_id      = parsed["sample_id"],
             drug            = drug,
             parsed          = parsed,
             phenotype_profile = phenotype_profile,
+            timestamp       = timestamp,
+            gene_variants_cache = gene_variants_cache,
+            risk            = risk,
         )
-        reports.append(report)
 
+    # Each report waits on its own Claude call, so fetch them concurrently;
+    # map() keeps the reports in test_drugs order.
+    with ThreadPoolExecutor(max_workers=len(test_drugs)) as pool:
+        reports = list(pool.map(report_for, test_drugs, risks))
+
+    for drug, report in zip(test_drugs, reports):
         ra = report["risk_assessment"]
         pp = report["pharmacogenomic_profile"]
         print(f"  Drug: {drug}")
@@ -171,8 +216,8 @@ def run_tests():
 
     # ── STEP 5: Write sample JSON output ────────────────────────────────────
     output_path = Path(__file__).parent / "sample_output.json"
-    with open(output_path, "w") as f:
-        json.dump(reports, f, indent=2)
+    with open(output_path, "wb") as f:
+        f.write(orjson.dumps(reports, option=orjson.OPT_INDENT_2))
 
     print(f"✅ Full JSON output written to: {output_path}")
     print()
@@ -181,7 +226,7 @@ def run_tests():
     print("─" * 70)
     print("SAMPLE JSON OUTPUT (CODEINE analysis):")
     print("─" * 70)
-    print(json.dumps(reports[0], indent=2))
+    print(orjson.dumps(reports[0], option=orjson.OPT_INDENT_2).decode())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+test_vcf_parser.py — Tests for the cyvcf2 region-query reader
+
+Checks parse_vcf_indexed against the line parser on a small bgzipped,
+tabix-indexed fixture (test_patient_indexed.vcf.gz + .tbi). Skipped when
+cyvcf2 is not installed.
+
+Usage:
+    python -m unittest test_vcf_parser
+"""
+
+# rift26-hackathon\ML\test_vcf_parser.py
+
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from vcf_parser import CYVCF2_AVAILABLE, parse_vcf, parse_vcf_indexed
+
+FIXTURE = str(Path(__file__).parent / "test_patient_indexed.vcf.gz")
+
+# Known rsID at chr1:1000, outside every GENE_POSITIONS region
+OUT_OF_REGION = ("chr1", 1000)
+
+
+def _by_locus(variants: list[dict]) -> list[dict]:
+    return sorted(variants, key=lambda v: (v["chromosome"], v["position"]))
+
+
+@unittest.skipUnless(CYVCF2_AVAILABLE, "cyvcf2 not installed")
+class ParseVcfIndexedTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.indexed = parse_vcf_indexed(FIXTURE)
+        cls.lines   = parse_vcf(FIXTURE)
+
+    def test_parse_vcf_does_not_switch_to_indexed_reader(self):
+        # All 11 records are read, including the one outside the PGx regions
+        self.assertEqual(self.lines["total_variants_parsed"], 11)
+        self.assertIn(OUT_OF_REGION, {(v["chromosome"], v["position"]) for v in self.lines["variants"]})
+
+    def test_matches_line_parser_inside_regions(self):
+        self.assertEqual(self.indexed["parse_errors"], [])
+        self.assertEqual(self.indexed["sample_id"], self.lines["sample_id"])
+        self.assertEqual(self.indexed["total_variants_parsed"], 10)
+        in_region = [
+            v for v in self.lines["variants"]
+            if (v["chromosome"], v["position"]) != OUT_OF_REGION
+        ]
+        self.assertEqual(_by_locus(self.indexed["variants"]), _by_locus(in_region))
+
+    def test_missing_filter_reported_as_dot(self):
+        filters = {v["position"]: v["filter"] for v in self.indexed["variants"]}
+        self.assertEqual(filters[94800000], ".")
+        self.assertEqual(filters[94781858], "PASS")
+
+    def test_non_string_gene_annotation_falls_back_to_position(self):
+        variant = next(v for v in self.indexed["variants"] if v["position"] == 94810000)
+        self.assertEqual(variant["gene"], "CYP2C19")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,13 +6,36 @@ for target genes: CYP2D6, CYP2C19, CYP2C9, SLCO1B1, TPMT, DPYD
 
 # rift26-hackathon\ML\vcf_parser.py
 
-import re
+import os
+import sys
+import gzip
+import mmap
 import logging
+from bisect import bisect_right
+from collections import defaultdict
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
 
 logger = logging.getLogger(__name__)
 
+try:
+    from cyvcf2 import VCF
+    CYVCF2_AVAILABLE = True
+except ImportError:
+    CYVCF2_AVAILABLE = False
+
+# isal's igzip is a drop-in gzip replacement with SIMD inflate, several times faster
+try:
+    from isal import igzip
+    ISAL_AVAILABLE = True
+except ImportError:
+    ISAL_AVAILABLE = False
+
+_gzip_open = igzip.open if ISAL_AVAILABLE else gzip.open
+
+# Compressed VCF suffixes (bgzip output is multi-member gzip, read the same way)
+GZIP_SUFFIXES = (".gz", ".bgz")
+
 # Target pharmacogenomic genes
 PGX_GENES = {"CYP2D6", "CYP2C19", "CYP2C9", "SLCO1B1", "TPMT", "DPYD"}
 
@@ -79,6 +102,14 @@ RSID_TO_STAR_ALLELE = {
     "rs75017182": "HapB3",
 }
 
+# Byte-keyed view for the parse loop: raw ID column → (gene, rsID, star allele).
+# Catalogued IDs are matched and reported without decoding, reusing the table's
+# own strings.
+_RSID_RECORDS = {
+    rsid.encode(): (gene, rsid, RSID_TO_STAR_ALLELE.get(rsid, "unknown"))
+    for rsid, gene in RSID_TO_GENE.items()
+}
+
 # Chromosomal position ranges for PGx genes (GRCh38)
 # Used as fallback when rsID is absent
 GENE_POSITIONS = {
@@ -91,6 +122,27 @@ GENE_POSITIONS = {
 }
 
 
+def _build_position_index() -> dict[str, tuple[list[int], list[Optional[str]]]]:
+    """
+    chrom → (breakpoints, genes): genes[i] covers positions from breakpoints[i]
+    up to breakpoints[i + 1]. Each segment takes the first GENE_POSITIONS entry
+    containing it, so overlapping ranges resolve exactly as the linear scan did.
+    """
+    index = {}
+    for chrom in {gc for gc, _, _ in GENE_POSITIONS.values()}:
+        ranges = [(gene, start, end) for gene, (gc, start, end) in GENE_POSITIONS.items() if gc == chrom]
+        breakpoints = sorted({start for _, start, _ in ranges} | {end + 1 for _, _, end in ranges})
+        genes = [
+            next((gene for gene, start, end in ranges if start <= point <= end), None)
+            for point in breakpoints
+        ]
+        index[chrom] = (breakpoints, genes)
+    return index
+
+
+_POSITION_INDEX = _build_position_index()
+
+
 def _normalize_chrom(chrom: str) -> str:
     """Normalize chromosome name: '1' → 'chr1', 'chr1' → 'chr1'."""
     if not chrom.startswith("chr"):
@@ -98,13 +150,35 @@ def _normalize_chrom(chrom: str) -> str:
     return chrom
 
 
+def _info_gene(info: str) -> Optional[str]:
+    """
+    Value of the first non-empty GENE= / gene= annotation in an INFO string,
+    e.g. "GENE=CYP2D6;AF=0.20" → "CYP2D6". Two str.find calls per try; an
+    empty value moves the search on, as the regex (?:GENE|gene)=([^;]+) would.
+    """
+    start = 0
+    while True:
+        i = info.find("GENE=", start)
+        j = info.find("gene=", start)
+        if i < 0 or 0 <= j < i:
+            i = j
+        if i < 0:
+            return None
+        end = info.find(";", i + 5)
+        value = info[i + 5:end] if end >= 0 else info[i + 5:]
+        if value:
+            return value
+        start = i + 1
+
+
 def _lookup_gene_by_position(chrom: str, pos: int) -> Optional[str]:
     """Return gene name if position falls within a known PGx gene region."""
-    norm = _normalize_chrom(chrom)
-    for gene, (gc, start, end) in GENE_POSITIONS.items():
-        if norm == gc and start <= pos <= end:
-            return gene
-    return None
+    entry = _POSITION_INDEX.get(_normalize_chrom(chrom))
+    if entry is None:
+        return None
+    breakpoints, genes = entry
+    i = bisect_right(breakpoints, pos) - 1
+    return genes[i] if i >= 0 else None
 
 
 def _parse_genotype(fmt_keys: list[str], sample_vals: list[str]) -> Optional[str]:
@@ -115,16 +189,19 @@ def _parse_genotype(fmt_keys: list[str], sample_vals: list[str]) -> Optional[str
     """
     if not fmt_keys or not sample_vals:
         return None
-    try:
-        gt_idx = fmt_keys.index("GT")
-        gt_raw = sample_vals[gt_idx]
-        # Normalize phased/unphased separator
-        return gt_raw.replace("|", "/")
-    except (ValueError, IndexError):
-        return None
-
-
-def _genotype_to_zygosity(gt: Optional[str]) -> str:
+    # GT is conventionally the first FORMAT key; only search when it is not
+    if fmt_keys[0] == "GT":
+        gt_raw = sample_vals[0]
+    else:
+        try:
+            gt_raw = sample_vals[fmt_keys.index("GT")]
+        except (ValueError, IndexError):
+            return None
+    # Normalize phased/unphased separator
+    return gt_raw.replace("|", "/") if "|" in gt_raw else gt_raw
+
+
+def _classify_genotype(gt: Optional[str]) -> str:
     """Convert genotype string to zygosity label."""
     if not gt:
         return "unknown"
@@ -141,155 +218,343 @@ def _genotype_to_zygosity(gt: Optional[str]) -> str:
     return "heterozygous"
 
 
-def parse_vcf(vcf_path: str) -> dict:
-    """
-    Main VCF parsing function.
+# Zygosity of every diploid GT over alleles 0-3 and '.', plus the no-GT cases,
+# so the common calls cost one dict probe instead of the branch chain
+_ZYGOSITY_BY_GT = {
+    gt: _classify_genotype(gt)
+    for gt in [None, ""] + [f"{a1}/{a2}" for a1 in "0123." for a2 in "0123."]
+}
 
-    Parameters
-    ----------
-    vcf_path : str
-        Path to VCF v4.2 file.
 
-    Returns
-    -------
-    dict with keys:
-        - sample_id : str
-        - variants  : list[dict]  — filtered PGx variants only
-        - parse_errors : list[str]
-        - total_variants_parsed : int
-        - pgx_variants_found : int
+def _genotype_to_zygosity(gt: Optional[str]) -> str:
+    """Convert genotype string to zygosity label."""
+    zygosity = _ZYGOSITY_BY_GT.get(gt)
+    return zygosity if zygosity is not None else _classify_genotype(gt)
+
+
+def _iter_vcf_lines(path: Path) -> Iterator[bytes]:
     """
-    path = Path(vcf_path)
-    if not path.exists():
-        raise FileNotFoundError(f"VCF file not found: {vcf_path}")
+    Raw lines of a VCF, undecoded and without their line terminator.
+    Plain files are scanned through mmap; .gz / .bgz files are streamed.
+    """
+    if path.suffix in GZIP_SUFFIXES:
+        with _gzip_open(path, "rb") as fh:
+            for line in fh:
+                yield line.rstrip(b"\r\n")
+        return
 
-    sample_id = "PATIENT_UNKNOWN"
-    variants = []
-    parse_errors = []
-    total_parsed = 0
-    header_parsed = False
-    column_names = []
+    with open(path, "rb") as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return  # mmap cannot map an empty file
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            start = 0
+            while start < size:
+                end = mm.find(b"\n", start)
+                if end < 0:
+                    end = size
+                yield mm[start:end].rstrip(b"\r")
+                start = end + 1
 
-    try:
-        with open(path, "r", encoding="utf-8", errors="replace") as fh:
-            for line_num, line in enumerate(fh, start=1):
-                line = line.rstrip("\n")
 
-                # ── Meta-information lines ────────────────────────────────
-                if line.startswith("##"):
-                    continue
+def _decode(raw: bytes) -> str:
+    return raw.decode("utf-8", "replace")
 
-                # ── Header line ───────────────────────────────────────────
-                if line.startswith("#CHROM"):
-                    column_names = line.lstrip("#").split("\t")
-                    # Sample ID is column index 9 (FORMAT is index 8)
-                    if len(column_names) > 9:
-                        raw_id = column_names[9].strip()
-                        sample_id = raw_id if raw_id else sample_id
-                    header_parsed = True
-                    continue
 
-                # Skip non-data lines before header
-                if not header_parsed:
-                    continue
+def _has_tabix_index(path: Path) -> bool:
+    return any(path.with_name(path.name + ext).exists() for ext in (".tbi", ".csi"))
 
-                # ── Data lines ────────────────────────────────────────────
-                if not line.strip():
-                    continue
 
-                fields = line.split("\t")
-                if len(fields) < 8:
-                    parse_errors.append(f"Line {line_num}: fewer than 8 fields — skipped")
-                    continue
+def _sample_id_from_path(path: Path) -> str:
+    """Fallback sample ID: the file name without .vcf / .vcf.gz / .vcf.bgz, upper-cased."""
+    stem = (Path(path.stem).stem if path.suffix in GZIP_SUFFIXES else path.stem).upper()
+    return stem if stem else "PATIENT_UNKNOWN"
 
-                total_parsed += 1
 
-                chrom  = fields[0].strip()
-                pos    = int(fields[1].strip()) if fields[1].strip().isdigit() else 0
-                rs_id  = fields[2].strip()   # '.' if missing
-                ref    = fields[3].strip()
-                alt    = fields[4].strip()
-                qual   = fields[5].strip()
-                flt    = fields[6].strip()
-                info   = fields[7].strip()
+def _detect_gene(rs_id: Optional[str], info_gene: Optional[str], chrom: str, pos: int) -> Optional[str]:
+    """rsID table first, then an INFO GENE= annotation, then the positional fallback."""
+    gene = RSID_TO_GENE.get(rs_id) if rs_id else None
+    if gene is None and info_gene:
+        candidate = info_gene.split(",")[0].strip()
+        if candidate in PGX_GENES:
+            gene = candidate
+    if gene is None:
+        gene = _lookup_gene_by_position(chrom, pos)
+    return gene
 
-                # Determine gene ───────────────────────────────────────────
-                gene = None
 
-                # 1) Check rsID lookup table
-                if rs_id and rs_id != ".":
-                    gene = RSID_TO_GENE.get(rs_id)
+def parse_vcf_indexed(vcf_path: str) -> dict:
+    """
+    Parse a bgzipped, tabix-indexed VCF with cyvcf2 (htslib), reading only
+    the GENE_POSITIONS regions instead of every record in the file.
+
+    Returns the same dict as parse_vcf. Records outside the PGx gene regions
+    are never read, so they are not counted in total_variants_parsed, and an
+    rsID or GENE= annotation outside those regions is not picked up. Because
+    of that it is opt-in: parse_vcf never switches to it on its own.
+    Index an existing file once with `tabix -p vcf file.vcf.gz`.
+    """
+    if not CYVCF2_AVAILABLE:
+        raise RuntimeError("parse_vcf_indexed requires the cyvcf2 package")
 
-                # 2) Parse INFO for gene annotations (ANN, CSQ, GENE fields)
-                if gene is None:
-                    gene_match = re.search(r'(?:GENE|gene)=([^;]+)', info)
-                    if gene_match:
-                        candidate = gene_match.group(1).split(",")[0].strip()
-                        if candidate in PGX_GENES:
-                            gene = candidate
+    path = Path(vcf_path)
+    if not path.exists():
+        raise FileNotFoundError(f"VCF file not found: {vcf_path}")
+    if not _has_tabix_index(path):
+        raise FileNotFoundError(f"No .tbi/.csi index next to {vcf_path}")
 
-                # 3) Positional fallback
-                if gene is None:
-                    gene = _lookup_gene_by_position(chrom, pos)
+    variants = []
+    parse_errors = []
+    total_parsed = 0
 
-                # Skip variants not in our PGx gene set
+    vcf = VCF(str(path))
+    try:
+        samples = vcf.samples
+        sample_id = samples[0].strip() if samples and samples[0].strip() else _sample_id_from_path(path)
+        seqnames = set(vcf.seqnames)
+
+        for region_chrom, start, end in GENE_POSITIONS.values():
+            # Files may name contigs "chr22" or "22"
+            contig = region_chrom if region_chrom in seqnames else region_chrom[3:]
+            if contig not in seqnames:
+                continue
+            try:
+                records = vcf(f"{contig}:{start}-{end}")
+            except Exception as exc:
+                parse_errors.append(f"{contig}:{start}-{end}: {exc}")
+                continue
+
+            for v in records:
+                total_parsed += 1
+                rs_id = v.ID or "."
+                info_gene = v.INFO.get("GENE") or v.INFO.get("gene")
+                # Multi-valued or non-String INFO fields come back as tuples or
+                # numbers; treat them as text the way the line parser sees them
+                if isinstance(info_gene, tuple):
+                    info_gene = ",".join(map(str, info_gene))
+                elif not isinstance(info_gene, str):
+                    info_gene = None
+                gene = _detect_gene(rs_id if rs_id != "." else None, info_gene, v.CHROM, v.POS)
                 if gene is None:
                     continue
 
-                # Parse genotype ───────────────────────────────────────────
                 genotype = None
-                if len(fields) >= 10:
-                    fmt_keys  = fields[8].split(":") if len(fields) > 8 else []
-                    smpl_vals = fields[9].split(":") if len(fields) > 9 else []
-                    genotype  = _parse_genotype(fmt_keys, smpl_vals)
-
+                if samples:
+                    # genotypes[0] is [allele1, allele2, ..., phased]; -1 is a missing call
+                    genotype = "/".join("." if a < 0 else str(a) for a in v.genotypes[0][:-1])
                 zygosity = _genotype_to_zygosity(genotype)
-
-                # Skip homozygous reference (no variant)
                 if zygosity == "homozygous_ref":
                     continue
 
-                star_allele = RSID_TO_STAR_ALLELE.get(rs_id, "unknown")
-
-                variant = {
-                    "chromosome":   _normalize_chrom(chrom),
-                    "position":     pos,
+                variants.append({
+                    "chromosome":   _normalize_chrom(v.CHROM),
+                    "position":     v.POS,
                     "rsid":         rs_id if rs_id != "." else None,
-                    "ref":          ref,
-                    "alt":          alt,
+                    "ref":          v.REF.upper(),
+                    "alt":          ",".join(v.ALT).upper() if v.ALT else ".",
                     "gene":         gene,
                     "genotype":     genotype,
                     "zygosity":     zygosity,
-                    "star_allele":  star_allele,
-                    "quality":      qual,
-                    "filter":       flt,
-                }
-                variants.append(variant)
-                logger.debug("PGx variant found: %s %s %s/%s [%s]", gene, rs_id, ref, alt, zygosity)
-
-    except Exception as exc:
-        logger.error("VCF parse error: %s", exc)
-        parse_errors.append(str(exc))
-
-    # Derive sample ID from filename if still unknown
-    if sample_id == "PATIENT_UNKNOWN":
-        stem = path.stem.upper()
-        sample_id = stem if stem else "PATIENT_UNKNOWN"
+                    "star_allele":  RSID_TO_STAR_ALLELE.get(rs_id, "unknown"),
+                    "quality":      f"{v.QUAL:g}" if v.QUAL is not None else ".",
+                    # FILTERS is ['PASS'] for PASS and [] for a missing '.'
+                    "filter":       ";".join(v.FILTERS) or ".",
+                })
+                logger.debug("PGx variant found: %s %s [%s]", gene, rs_id, zygosity)
+    finally:
+        vcf.close()
 
     return {
         "sample_id":              sample_id,
         "variants":               variants,
         "parse_errors":           parse_errors,
+        "read_error":             None,
         "total_variants_parsed":  total_parsed,
         "pgx_variants_found":     len(variants),
     }
 
 
+def _variant_from_fields(fields: list[bytes]) -> Optional[dict]:
+    """
+    Variant dict for one split data line (at least 8 columns), or None if the
+    record is outside the PGx genes or homozygous reference.
+    """
+    chrom  = _decode(fields[0].strip())
+    pos_b  = fields[1].strip()
+    pos    = int(pos_b) if pos_b.isdigit() else 0
+
+    # Determine gene ───────────────────────────────────────────────
+    # 1) Check rsID lookup table ('.' and '' are never keys)
+    rsid_record = _RSID_RECORDS.get(fields[2].strip())
+    gene = rsid_record[0] if rsid_record else None
+
+    # 2) Parse INFO for gene annotations (ANN, CSQ, GENE fields)
+    # 3) Positional fallback
+    if gene is None:
+        # Decode INFO only if it can hold an annotation; most records have none
+        info = fields[7]
+        info_gene = _info_gene(_decode(info.strip())) if b"GENE=" in info or b"gene=" in info else None
+        gene = _detect_gene(None, info_gene, chrom, pos)
+
+    # Skip variants not in our PGx gene set
+    if gene is None:
+        return None
+
+    # Parse genotype ───────────────────────────────────────────────
+    genotype = None
+    if len(fields) >= 10:
+        fmt_keys  = _decode(fields[8]).split(":")
+        smpl_vals = _decode(fields[9]).split(":")
+        genotype  = _parse_genotype(fmt_keys, smpl_vals)
+
+    zygosity = _genotype_to_zygosity(genotype)
+
+    # Skip homozygous reference (no variant)
+    if zygosity == "homozygous_ref":
+        return None
+
+    if rsid_record:
+        _, rs_id, star_allele = rsid_record
+    else:
+        rs_id, star_allele = _decode(fields[2].strip()), "unknown"   # '.' if missing
+    ref    = _decode(fields[3].strip()).upper()   # VCF allows lowercase bases
+    alt    = _decode(fields[4].strip()).upper()
+
+    # Chromosome, genotype and FILTER take a handful of distinct values, so
+    # interning lets every variant share one string object per value
+    variant = {
+        "chromosome":   sys.intern(_normalize_chrom(chrom)),
+        "position":     pos,
+        "rsid":         rs_id if rs_id != "." else None,
+        "ref":          ref,
+        "alt":          alt,
+        "gene":         gene,
+        "genotype":     sys.intern(genotype) if genotype else genotype,
+        "zygosity":     zygosity,
+        "star_allele":  star_allele,
+        "quality":      _decode(fields[5].strip()),
+        "filter":       sys.intern(_decode(fields[6].strip())),
+    }
+    logger.debug("PGx variant found: %s %s %s/%s [%s]", gene, rs_id, ref, alt, zygosity)
+    return variant
+
+
+def parse_vcf(vcf_path: str) -> dict:
+    """
+    Main VCF parsing function.
+
+    Parameters
+    ----------
+    vcf_path : str
+        Path to VCF v4.2 file. Paths ending in .gz / .bgz are decompressed
+        line-by-line while reading (with isal when installed). Lines are
+        handled as bytes and only the columns of kept PGx variants are
+        decoded. Every record is read; call parse_vcf_indexed explicitly to
+        read only the PGx regions of a tabix-indexed file.
+
+    Returns
+    -------
+    dict with keys:
+        - sample_id : str
+        - variants  : list[dict]  — filtered PGx variants only
+        - parse_errors : list[str]
+        - read_error : str | None — set when reading stopped part-way (I/O or
+          decompression failure); also listed in parse_errors
+        - total_variants_parsed : int
+        - pgx_variants_found : int
+    """
+    path = Path(vcf_path)
+    if not path.exists():
+        raise FileNotFoundError(f"VCF file not found: {vcf_path}")
+
+    # Unbounded chunk size: the whole file comes back as one chunk
+    return next(parse_vcf_chunks(vcf_path, chunk_size=None))
+
+
+def parse_vcf_chunks(vcf_path: str, chunk_size: Optional[int] = 100_000) -> Iterator[dict]:
+    """
+    Stream a VCF in batches so memory stays bounded on cohort-sized files.
+
+    Yields dicts shaped like parse_vcf's result, each holding at most
+    `chunk_size` variants (None = no limit, a single chunk). The counts and
+    parse_errors of each chunk cover only the lines read since the previous
+    one, so they sum to the whole-file figures. At least one chunk is always
+    yielded. Files are read with the line parser, never parse_vcf_indexed.
+    """
+    path = Path(vcf_path)
+    if not path.exists():
+        raise FileNotFoundError(f"VCF file not found: {vcf_path}")
+
+    sample_id = "PATIENT_UNKNOWN"
+    variants = []
+    parse_errors = []
+    total_parsed = 0
+    header_parsed = False
+    read_error = None
+
+    def chunk() -> dict:
+        # Derive sample ID from filename if still unknown
+        return {
+            "sample_id":              sample_id if sample_id != "PATIENT_UNKNOWN" else _sample_id_from_path(path),
+            "variants":               variants,
+            "parse_errors":           parse_errors,
+            "read_error":             read_error,
+            "total_variants_parsed":  total_parsed,
+            "pgx_variants_found":     len(variants),
+        }
+
+    try:
+        for line_num, line in enumerate(_iter_vcf_lines(path), start=1):
+
+            # ── Meta-information lines ────────────────────────────────────
+            if line[:2] == b"##":
+                continue
+
+            # ── Header line ───────────────────────────────────────────────
+            if line[:6] == b"#CHROM":
+                column_names = _decode(line).lstrip("#").split("\t")
+                # Sample ID is column index 9 (FORMAT is index 8)
+                if len(column_names) > 9:
+                    raw_id = column_names[9].strip()
+                    sample_id = raw_id if raw_id else sample_id
+                header_parsed = True
+                continue
+
+            # Skip non-data lines before header
+            if not header_parsed:
+                continue
+
+            # ── Data lines ────────────────────────────────────────────────
+            if not line.strip():
+                continue
+
+            # Columns past the first sample are never read
+            fields = line.split(b"\t", 10)
+            if len(fields) < 8:
+                parse_errors.append(f"Line {line_num}: fewer than 8 fields — skipped")
+                continue
+
+            total_parsed += 1
+
+            variant = _variant_from_fields(fields)
+            if variant is not None:
+                variants.append(variant)
+                if chunk_size and len(variants) >= chunk_size:
+                    yield chunk()
+                    variants, parse_errors, total_parsed = [], [], 0
+
+    except Exception as exc:
+        logger.error("VCF parse error: %s", exc)
+        read_error = str(exc)
+        parse_errors.append(read_error)
+
+    yield chunk()
+
+
 def group_variants_by_gene(variants: list[dict]) -> dict[str, list[dict]]:
     """Group parsed variants by gene name for downstream phenotype mapping."""
-    grouped: dict[str, list[dict]] = {g: [] for g in PGX_GENES}
+    by_gene: defaultdict[str, list[dict]] = defaultdict(list)
     for v in variants:
-        gene = v.get("gene")
-        if gene in grouped:
-            grouped[gene].append(v)
-    return grouped
\ No newline at end of file
+        by_gene[v.get("gene")].append(v)
+    # Every PGx gene gets an entry, even with no variants; anything else is dropped
+    return {g: by_gene.get(g, []) for g in PGX_GENES}
\ No newline at end of file